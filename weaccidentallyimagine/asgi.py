@@ -0,0 +1,18 @@
+"""
+ASGI config for book project.
+
+It exposes the ASGI callable as a module-level variable named `application`.
+Set `ASYNC_RENDERING` in `settings.py` when serving through it, so renders
+are handed to a worker pool instead of blocking the event loop.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+application = get_asgi_application()
@@ -1,7 +1,34 @@
 """Django app configuration"""
 
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
+
+
+def _start_corpus_watcher(**kwargs):
+    # Imported here, like the modules loaded in `ready()`, so importing
+    # the app config doesn't load the engine
+    from .engine import corpus_watcher
+    corpus_watcher.start(settings.CORPUS_RELOAD_INTERVAL)
 
 
 class MainConfig(AppConfig):
     name = 'main'
+
+    def ready(self):
+        # Build the poems and the page assembler, and map the compiled
+        # corpus if there is one, once at startup rather than on the first
+        # request
+        from .engine import registry
+        from .engine.compiled_corpus import get_compiled_corpus
+        from .page_assembler import get_page_assembler
+        registry.load()
+        get_compiled_corpus()
+        get_page_assembler()
+        # Swap in edited poems and texts while serving (see `settings.py`).
+        # Each process starts its own watcher on its first request, since
+        # a server which loads the app before forking its workers (like
+        # `gunicorn --preload`) would leave a thread started now behind
+        if settings.CORPUS_RELOAD_INTERVAL:
+            request_started.connect(_start_corpus_watcher,
+                                    dispatch_uid='start_corpus_watcher')
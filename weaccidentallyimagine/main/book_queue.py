@@ -0,0 +1,160 @@
+"""A queue of random books rendered ahead of time for the root URL.
+
+Every visit to `/` gets a book from a new random seed, so those pages can't
+be cached and used to be rendered while the visitor waited. Instead, a
+background thread keeps up to `RANDOM_BOOK_QUEUE_DEPTH` books rendered from
+fresh random seeds (see `settings.py`), and `/` takes the next one. A book
+is only rendered on request when the queue has run dry. The thread renders
+no more than `RANDOM_BOOK_QUEUE_REFILL_RATE` books a second, so refilling
+the queue after a burst of visits can't starve the views of CPU.
+
+The thread is started by the first request for a random book, so commands
+and worker processes which never serve `/` don't render books for nothing.
+"""
+
+from collections import namedtuple
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics, render_pool
+from .engine.timing import RenderTimer
+
+logger = logging.getLogger(__name__)
+
+# Longest wait, in seconds, between attempts to render a book for the queue
+# while renders keep failing
+MAX_RETRY_DELAY = 60
+
+QueuedBook = namedtuple('QueuedBook', ('seed', 'version', 'year', 'page'))
+QueuedBook.__doc__ = """A random book rendered ahead of time.
+
+Attributes:
+    seed (int): The book's random seed
+    version (str): The engine and corpus version it was rendered with
+    year (int): The year printed in its prelude
+    page (str): The rendered page
+"""
+
+
+class BookQueue:
+    """A bounded queue of random books, kept full by a background thread."""
+
+    def __init__(self, depth, refill_rate):
+        """
+        Args:
+            depth (int): Most books to keep ready
+            refill_rate (float): Most books to render a second
+        """
+        self.refill_rate = refill_rate
+        self._books = queue.Queue(depth)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._books.qsize()
+
+    def start(self):
+        """Start refilling the queue in the background, if not started."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._refill, name='book-queue', daemon=True)
+                self._thread.start()
+
+    def pop(self, version, year):
+        """
+        Take the next ready book, discarding any which are out of date.
+
+        Args:
+            version (str): The current engine and corpus version
+            year (int): The year the book should print in its prelude
+
+        Returns:
+            Optional[QueuedBook]: The book, or `None` if none is ready
+        """
+        while True:
+            try:
+                book = self._books.get_nowait()
+            except queue.Empty:
+                metrics.observe_book_queue(len(self), ready=False)
+                return None
+            if book.version == version and book.year == year:
+                metrics.observe_book_queue(len(self), ready=True)
+                return book
+
+    def _refill(self):
+        failures = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                book = _render_book()
+            except render_pool.RenderPoolShutDown:
+                # Nothing more can be rendered once the process is exiting
+                return
+            except Exception:
+                logger.exception('Failed to render a book for the queue')
+                failures += 1
+            else:
+                failures = 0
+                # Blocks while the queue is full
+                self._books.put(book)
+                metrics.observe_book_queue(len(self))
+            # Back off while renders keep failing, rather than logging the
+            # same error as fast as the refill rate allows
+            interval = min(2 ** failures / self.refill_rate,
+                           max(MAX_RETRY_DELAY, 1 / self.refill_rate))
+            time.sleep(max(0, interval - (time.perf_counter() - started)))
+
+
+def _render_book():
+    """Render a book from a new random seed, recording it in the metrics.
+
+    Under ASGI, the book is rendered in the render pool (see
+    `render_pool.py`) rather than in this process, which is busy serving
+    the event loop.
+
+    Returns:
+        QueuedBook
+    """
+    # Imported here since the views import this module
+    from .views import page_version, random_seed, render_page
+    seed = random_seed()
+    version = page_version()
+    year = timezone.now().year
+    if settings.ASYNC_RENDERING:
+        page, timer = render_pool.render_page_blocking(seed, False, year,
+                                                       compress=False)
+    else:
+        timer = RenderTimer()
+        page = render_page(None, seed, False, year, False, timer)
+    metrics.observe_render(timer, 'background')
+    return QueuedBook(seed, version, year, page)
+
+
+_book_queue = None
+_book_queue_lock = threading.Lock()
+
+
+def get_book_queue():
+    """
+    Get the process-wide random book queue, creating and starting it from
+    settings if needed.
+
+    Returns:
+        Optional[BookQueue]: The queue, or `None` if it is disabled by
+        setting `RANDOM_BOOK_QUEUE_DEPTH` to 0
+    """
+    global _book_queue
+    if not settings.RANDOM_BOOK_QUEUE_DEPTH:
+        return None
+    with _book_queue_lock:
+        if _book_queue is None:
+            _book_queue = BookQueue(settings.RANDOM_BOOK_QUEUE_DEPTH,
+                                    settings.RANDOM_BOOK_QUEUE_REFILL_RATE)
+            _book_queue.start()
+        return _book_queue
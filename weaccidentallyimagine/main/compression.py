@@ -0,0 +1,117 @@
+"""Pre-compression of rendered pages and `Accept-Encoding` negotiation.
+
+Cached pages are stored in every encoding at once (see `compress_page()`),
+so serving a cached page to any client is just a matter of picking the
+stored encoding it accepts.
+
+Brotli is an optional dependency. Without the `brotli` package, pages are
+only stored raw and gzipped.
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IDENTITY = 'identity'
+GZIP = 'gzip'
+BROTLI = 'br'
+
+# The encodings served, from most to least preferred when a client accepts
+# several equally
+PREFERENCE = (BROTLI, GZIP, IDENTITY)
+
+# The encodings `compress_page()` stores each page in
+ENCODINGS = (IDENTITY, GZIP) if brotli is None else (IDENTITY, GZIP, BROTLI)
+
+# Pages are compressed as they are cached, while the client of a cache miss
+# is waiting, so both are kept to levels which are fast. On a 170KB page,
+# gzip's level 9 takes 65% longer than level 6 for 1% smaller output, and
+# brotli's quality 4 takes about half as long as 5 yet still beats gzip.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+def compress_page(page):
+    """
+    Encode a rendered page in every supported encoding.
+
+    Args:
+        page (bytes): The rendered page
+
+    Returns:
+        dict[str, bytes]: The page keyed by encoding name, always including
+        `IDENTITY` and `GZIP`, and `BROTLI` if `brotli` is installed
+    """
+    encodings = {
+        IDENTITY: page,
+        GZIP: gzip.compress(page, GZIP_LEVEL, mtime=0),
+    }
+    if brotli is not None:
+        encodings[BROTLI] = brotli.compress(page, quality=BROTLI_QUALITY)
+    return encodings
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an `Accept-Encoding` header into quality values.
+
+    Args:
+        header (str): The header's value
+
+    Returns:
+        dict[str, float]: The quality of each listed coding, lowercased
+
+    Example:
+        >>> parse_accept_encoding('gzip, br;q=0.8, *;q=0')
+        {'gzip': 1.0, 'br': 0.8, '*': 0.0}
+    """
+    qualities = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def choose_encoding(header, available):
+    """
+    Pick the encoding to send a page in.
+
+    Args:
+        header (str): The request's `Accept-Encoding` header
+        available (Iterable[str]): The encodings the page is stored in
+
+    Returns:
+        str: The available encoding the client accepts with the highest
+        quality, ties going to the smaller encoding. If the client accepts
+        none of them, `IDENTITY`, since the raw page is more useful than
+        an error.
+    """
+    qualities = parse_accept_encoding(header)
+    default = qualities.get('*')
+    best = IDENTITY
+    best_quality = 0
+    for encoding in PREFERENCE:
+        if encoding not in available:
+            continue
+        quality = qualities.get(encoding, default)
+        if quality is None:
+            # Unlisted codings are unacceptable, except for the raw page,
+            # which is sent only if nothing listed is available
+            quality = 0.001 if encoding == IDENTITY else 0
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
@@ -0,0 +1,240 @@
+"""A compiled corpus file which processes map into memory read-only.
+
+Every process rendering mutable poems needs the transition table of each
+poem (see `transition_table.py`), and compiling them from the texts leaves
+each process holding its own copy of the same arrays. `compile_corpus()`
+(run through `manage.py compile_corpus`) instead writes every table once
+into a single binary file, which processes map with `mmap`. The operating
+system then keeps one physical copy of the arrays for all of them, and
+loading the tables only takes parsing the file's small index. The tables'
+tokens are IDs in the corpus-wide vocabulary (see `vocabulary.py`), whose
+strings are stored once in the index.
+
+The file is named after, and stamped with, the corpus version (see
+`corpus.py`), so a stale file is never used. After the engine, `poems.py`
+or a text changes, processes compile their own tables as before until the
+file is compiled again.
+
+Layout, in native byte order:
+
+    magic (8 bytes) | format version (uint32) | index length (uint32)
+    index (UTF-8 JSON) | arrays, each starting at a multiple of 8 bytes
+"""
+
+from array import array
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import warnings
+
+from . import registry
+from .corpus import corpus_version
+from .soft_poem import SOURCE_DIR
+from .transition_table import TransitionTable
+from .vocabulary import get_vocabulary
+
+MAGIC = b'WAICORP\0'
+FORMAT_VERSION = 3
+HEADER = struct.Struct('=8sII')
+
+# Where compiled corpus files are written and looked for
+COMPILED_DIR = os.path.join(os.path.dirname(__file__), 'compiled')
+
+# The type of each of a transition table's arrays in the file
+ARRAY_TYPES = (
+    ('tokens', 'i'),
+    ('offsets', 'q'),
+    ('targets', 'q'),
+    ('cumulative', 'd'),
+    ('totals', 'd'),
+)
+
+_ALIGNMENT = 8
+
+
+def corpus_path(version=None, directory=COMPILED_DIR):
+    """
+    Get the path of the compiled corpus file for a corpus version.
+
+    Args:
+        version (Optional[str]): The corpus version. Defaults to the
+            current one.
+        directory (str): The directory compiled files are kept in
+
+    Returns:
+        str
+    """
+    if version is None:
+        version = corpus_version()
+    return os.path.join(directory, 'corpus-{}-f{}.bin'.format(
+        version, FORMAT_VERSION))
+
+
+def write_corpus(path, tables, vocabulary, version):
+    """
+    Write transition tables to a compiled corpus file.
+
+    The file is written under a temporary name and then moved into place,
+    so processes never map a partly written file.
+
+    Args:
+        path (str): The file to write
+        tables (dict[str, tuple[str, TransitionTable]]): The path of each
+            table's text within `SOURCE_DIR`, and the table, keyed by the
+            table's model key (see `model_store.model_key()`)
+        vocabulary (Vocabulary): The vocabulary the tables' tokens refer to
+        version (str): The corpus version the tables were compiled from
+    """
+    entries = []
+    blobs = []
+    position = 0
+    for key, (filename, table) in tables.items():
+        arrays = {}
+        for name, typecode in ARRAY_TYPES:
+            blob = array(typecode, getattr(table, name)).tobytes()
+            arrays[name] = [position, len(blob)]
+            padding = -len(blob) % _ALIGNMENT
+            blobs.append(blob + bytes(padding))
+            position += len(blob) + padding
+        entries.append({
+            'model_key': key,
+            'filename': filename,
+            'arrays': arrays,
+        })
+    index = json.dumps({
+        'corpus_version': version,
+        'byteorder': sys.byteorder,
+        'vocabulary': vocabulary.words,
+        'tables': entries,
+    }).encode()
+    # Pad the index so the arrays after it stay aligned
+    index += b' ' * (-(HEADER.size + len(index)) % _ALIGNMENT)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(),
+                                      threading.get_ident())
+    with open(temp_path, 'wb') as corpus_file:
+        corpus_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(index)))
+        corpus_file.write(index)
+        for blob in blobs:
+            corpus_file.write(blob)
+    os.replace(temp_path, path)
+
+
+def compile_corpus(directory=COMPILED_DIR):
+    """
+    Compile the transition table of every poem into a corpus file.
+
+    Tables whose text and distance weights haven't changed since they were
+    last compiled are taken from the model store (see `model_store.py`).
+
+    Args:
+        directory (str): The directory to write the file to
+
+    Returns:
+        str: The path of the written file
+    """
+    # Imported here since the model store keeps tables in this module's
+    # file format
+    from .model_store import get_model_store, model_key
+    store = get_model_store()
+    tables = {}
+    for poem in registry.build_poems():
+        key = model_key(poem.source_digest, poem.distance_weights)
+        if key not in tables:
+            tables[key] = (
+                os.path.relpath(poem.filepath, SOURCE_DIR),
+                store.load(poem.filepath, poem.distance_weights,
+                           poem.source_digest))
+    path = corpus_path(directory=directory)
+    write_corpus(path, tables, get_vocabulary(), corpus_version())
+    return path
+
+
+class CompiledCorpus:
+    """The transition tables of a compiled corpus file, mapped read-only.
+
+    The tables' arrays are views straight into the mapped file, so they
+    take no memory of their own. That includes their tokens, as long as
+    the file's vocabulary agrees with the process's, which it does for
+    files compiled from the same corpus. Otherwise, the tokens are copied
+    into arrays of the process's own vocabulary IDs.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The compiled corpus file to map
+
+        Raises:
+            ValueError: If the file isn't a compiled corpus this version of
+                the engine can read
+        """
+        self.path = path
+        with open(path, 'rb') as corpus_file:
+            self._map = mmap.mmap(corpus_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        magic, format_version, index_length = HEADER.unpack_from(self._map)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError('{} is not a compiled corpus of format {}'
+                             .format(path, FORMAT_VERSION))
+        index = json.loads(bytes(
+            self._map[HEADER.size:HEADER.size + index_length]))
+        if index['byteorder'] != sys.byteorder:
+            raise ValueError('{} was compiled on a {}-endian machine'
+                             .format(path, index['byteorder']))
+        self.version = index['corpus_version']
+        data = memoryview(self._map)[HEADER.size + index_length:]
+        vocabulary = get_vocabulary()
+        words = index['vocabulary']
+        if vocabulary.words[:len(words)] == words:
+            id_map = None
+        else:
+            id_map = vocabulary.encode(words)
+        self.tables = {}
+        for entry in index['tables']:
+            arrays = []
+            for name, typecode in ARRAY_TYPES:
+                start, length = entry['arrays'][name]
+                arrays.append(data[start:start + length].cast(typecode))
+            if id_map is not None:
+                arrays[0] = array('i', [id_map[word_id]
+                                        for word_id in arrays[0]])
+            self.tables[entry['model_key']] = TransitionTable(vocabulary,
+                                                              *arrays)
+
+
+_compiled_corpus = None
+_compiled_version = None
+_lock = threading.Lock()
+
+
+def get_compiled_corpus():
+    """
+    Map the compiled corpus file of the current corpus version, if any.
+
+    The file is mapped once per process and version.
+
+    Returns:
+        Optional[CompiledCorpus]: The mapped corpus, or `None` if no file
+        has been compiled for the current version
+    """
+    global _compiled_corpus, _compiled_version
+    version = corpus_version()
+    with _lock:
+        if _compiled_version != version:
+            try:
+                _compiled_corpus = CompiledCorpus(corpus_path(version))
+            except FileNotFoundError:
+                _compiled_corpus = None
+            except ValueError as error:
+                warnings.warn('Ignoring compiled corpus: {}'.format(error))
+                _compiled_corpus = None
+            if (_compiled_corpus is not None and
+                    _compiled_corpus.version != version):
+                # A file renamed by hand; its tables can't be trusted
+                _compiled_corpus = None
+            _compiled_version = version
+        return _compiled_corpus
@@ -0,0 +1,95 @@
+"""Versioning of the rendering engine and of the corpus it renders.
+
+Anything which stores rendered output across requests should key it on
+`corpus_version()`, which changes whenever the engine's behavior, the poem
+configuration in `poems.py`, or any of the source texts change. Within a
+running process, the corpus part of the version is that of the poems in
+use, so it changes when edited poems are reloaded (see `registry.py`).
+"""
+
+import hashlib
+import os
+
+from .soft_poem import SOURCE_DIR
+
+# Bump whenever a change to the engine alters what a given seed renders
+ENGINE_VERSION = 5
+
+POEMS_CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'poems.py')
+
+_corpus_hash = None
+
+
+def source_digests():
+    """
+    Hash the poem configuration and each source text.
+
+    Returns:
+        dict[str, bytes]: The SHA-256 digest of `poems.py` and of every
+        file in `SOURCE_DIR`, keyed by file name, `poems.py` first
+    """
+    paths = [POEMS_CONFIG_PATH] + [
+        os.path.join(SOURCE_DIR, filename)
+        for filename in sorted(os.listdir(SOURCE_DIR))]
+    digests = {}
+    for path in paths:
+        with open(path, 'rb') as source_file:
+            contents = source_file.read()
+        digests[os.path.basename(path)] = hashlib.sha256(contents).digest()
+    return digests
+
+
+def compute_corpus_hash(digests=None):
+    """
+    Hash the poem configuration and every source text.
+
+    Args:
+        digests (Optional[dict[str, bytes]]): The digests of the files, as
+            returned by `source_digests()`. Read from disk if not given.
+
+    Returns:
+        str: A hex digest of the contents of `poems.py` and `SOURCE_DIR`
+    """
+    if digests is None:
+        digests = source_digests()
+    digest = hashlib.sha256()
+    for name, file_digest in digests.items():
+        digest.update(name.encode())
+        digest.update(file_digest)
+    return digest.hexdigest()
+
+
+def corpus_hash():
+    """
+    Get the corpus hash, computing it on first use.
+
+    Returns:
+        str: A hex digest of the poem configuration and source texts
+    """
+    global _corpus_hash
+    if _corpus_hash is None:
+        _corpus_hash = compute_corpus_hash()
+    return _corpus_hash
+
+
+def set_corpus_hash(new_hash):
+    """
+    Replace the corpus hash, once the poems built from a new version of
+    the corpus are in use (see `registry.reload()`).
+
+    Args:
+        new_hash (str): The hash of the new corpus, from
+            `compute_corpus_hash()`
+    """
+    global _corpus_hash
+    _corpus_hash = new_hash
+
+
+def corpus_version():
+    """
+    Get a short string identifying the engine and corpus in use.
+
+    Returns:
+        str: The engine version and corpus hash, e.g. `'1-3fa29c0d1b2e4f5a'`
+    """
+    return '{}-{}'.format(ENGINE_VERSION, corpus_hash()[:16])
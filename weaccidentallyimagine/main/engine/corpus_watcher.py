@@ -0,0 +1,108 @@
+"""Watching the poem configuration and texts for edits.
+
+A `CorpusWatcher` polls the modification times and sizes of `poems.py` and
+every file in `SOURCE_DIR` from a background thread. When any of them
+change, it calls `registry.reload()`, which rebuilds only the poems that
+changed and swaps them in once they are ready, so requests never wait on
+a rebuild and the process never has to restart.
+"""
+
+import logging
+import os
+import threading
+
+from . import registry
+from .corpus import POEMS_CONFIG_PATH
+from .soft_poem import SOURCE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def _stat_signature():
+    paths = [POEMS_CONFIG_PATH] + [
+        os.path.join(SOURCE_DIR, filename)
+        for filename in sorted(os.listdir(SOURCE_DIR))]
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return signature
+
+
+class CorpusWatcher:
+    """A background thread reloading the poems whenever their files change."""
+
+    def __init__(self, interval):
+        """
+        Args:
+            interval (float): Seconds to wait between polls
+        """
+        self.interval = interval
+        self._signature = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start polling in a daemon thread."""
+        self._signature = _stat_signature()
+        self._thread = threading.Thread(target=self._watch,
+                                        name='corpus-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling after the current poll."""
+        self._stopped.set()
+
+    def poll(self):
+        """
+        Reload the poems if any of their files changed since the last poll.
+
+        Returns:
+            bool: Whether any poem changed
+        """
+        signature = _stat_signature()
+        if signature == self._signature:
+            return False
+        # Remembered before reloading, so a file which fails to load is
+        # only retried once it is written again
+        self._signature = signature
+        changed = registry.reload()
+        if changed:
+            logger.info('Reloaded poems')
+        return changed
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                # A half-written file or a broken `poems.py` shouldn't stop
+                # the watcher, the poems in use are kept until it is fixed
+                logger.exception('Failed to reload poems')
+
+
+_watcher = None
+_watcher_pid = None
+_lock = threading.Lock()
+
+
+def start(interval):
+    """
+    Start the process-wide corpus watcher, if it isn't running yet.
+
+    A process forked from one running a watcher doesn't inherit its
+    thread, so it starts a watcher of its own.
+
+    Args:
+        interval (float): Seconds to wait between polls
+
+    Returns:
+        CorpusWatcher
+    """
+    global _watcher, _watcher_pid
+    with _lock:
+        if _watcher is None or _watcher_pid != os.getpid():
+            _watcher = CorpusWatcher(interval)
+            _watcher_pid = os.getpid()
+            _watcher.start()
+        return _watcher
@@ -0,0 +1,159 @@
+"""A persistent store of compiled transition tables, keyed by content.
+
+A transition table depends only on its text, its distance weights and the
+way texts are tokenized and linked (`transition_table.TOKENIZER_VERSION`).
+`model_key()` hashes exactly those, so after retuning the distance weights
+of some poems in `poems.py` or editing some of the texts, only their tables
+are compiled again and every other table is read back from the store. Both
+`compiled_corpus.compile_corpus()` and processes compiling their own tables
+(see `transition_table.load_transition_table()`) go through the store.
+
+Each table is kept in a file of its own, in the format of a compiled corpus
+holding a single table (see `compiled_corpus.py`), and mapped read-only in
+the same way.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import warnings
+
+from .compiled_corpus import COMPILED_DIR, CompiledCorpus, write_corpus
+from .soft_poem import SOURCE_DIR
+from .transition_table import TOKENIZER_VERSION, TransitionTable
+from .vocabulary import Vocabulary
+
+# Where stored tables are kept
+STORE_DIR = os.path.join(COMPILED_DIR, 'models')
+
+
+def model_key(source_digest, distance_weights):
+    """
+    Hash everything a transition table depends on.
+
+    Args:
+        source_digest (str): The hex SHA-256 digest of the text the table
+            is compiled from
+        distance_weights (dict): Dict of relative indices to weights
+
+    Returns:
+        str: A hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update('{}\0'.format(TOKENIZER_VERSION).encode())
+    digest.update(source_digest.encode())
+    digest.update(json.dumps(sorted(distance_weights.items())).encode())
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """A directory of compiled transition tables, one file per model key."""
+
+    def __init__(self, directory=STORE_DIR):
+        """
+        Args:
+            directory (str): The directory tables are kept in
+        """
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{}.bin'.format(key))
+
+    def get(self, key):
+        """
+        Look up a stored table.
+
+        Args:
+            key (str): The table's model key (see `model_key()`)
+
+        Returns:
+            Optional[TransitionTable]: The table, or `None` if it isn't
+            stored
+        """
+        try:
+            model = CompiledCorpus(self._path(key))
+        except FileNotFoundError:
+            return None
+        except ValueError as error:
+            warnings.warn('Ignoring stored table: {}'.format(error))
+            return None
+        if model.version != key or len(model.tables) != 1:
+            return None
+        return next(iter(model.tables.values()))
+
+    def put(self, key, table, filename):
+        """
+        Store a table.
+
+        The table's tokens are written with a vocabulary of their own, so
+        the stored file doesn't depend on the IDs of this process's
+        vocabulary.
+
+        Args:
+            key (str): The table's model key (see `model_key()`)
+            table (TransitionTable): The table
+            filename (str): The path of its text within `SOURCE_DIR`
+        """
+        words = table.vocabulary.words
+        vocabulary = Vocabulary()
+        tokens = vocabulary.encode(words[word_id] for word_id in table.tokens)
+        own_table = TransitionTable(vocabulary, tokens, table.offsets,
+                                    table.targets, table.cumulative,
+                                    table.totals)
+        write_corpus(self._path(key), {key: (filename, own_table)},
+                     vocabulary, key)
+
+    def load(self, path, distance_weights, source_digest):
+        """
+        Get the table of a text, compiling and storing it if it isn't
+        stored yet.
+
+        Failing to store a table (in a read-only deployment, for example)
+        only means it is compiled again next time.
+
+        Args:
+            path (str): Path to the source text
+            distance_weights (dict): Dict of relative indices to weights
+            source_digest (str): The hex SHA-256 digest of the text
+
+        Returns:
+            TransitionTable
+
+        Raises:
+            ValueError: If the table has to be compiled, but the text at
+                `path` no longer matches `source_digest`
+        """
+        key = model_key(source_digest, distance_weights)
+        table = self.get(key)
+        if table is not None:
+            return table
+        with open(path, 'rb') as source_file:
+            source = source_file.read()
+        if hashlib.sha256(source).hexdigest() != source_digest:
+            raise ValueError('{} has changed since it was read'.format(path))
+        table = TransitionTable.from_string(source.decode(),
+                                            distance_weights)
+        try:
+            self.put(key, table, os.path.relpath(path, SOURCE_DIR))
+        except OSError:
+            pass
+        return table
+
+
+_model_store = None
+_lock = threading.Lock()
+
+
+def get_model_store():
+    """
+    Get the process-wide model store.
+
+    Returns:
+        ModelStore
+    """
+    global _model_store
+    with _lock:
+        if _model_store is None:
+            _model_store = ModelStore()
+        return _model_store
@@ -0,0 +1,116 @@
+"""Rendering the poems of a book, one by one or across a pool of processes.
+
+Once a book's poems are ordered, each one draws only from its own random
+source, seeded by `seeded_random.poem_seed()`. The poems are therefore
+independent of each other, and can be rendered concurrently in separate
+processes while still rendering exactly the same book.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+
+from . import registry
+from .corpus import corpus_version
+from .seeded_random import SeededRandom, poem_seed
+from .timing import NULL_TIMER, RenderTimer
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def render_poem(poem, seed, batched=False, timer=NULL_TIMER):
+    """
+    Render one poem as it appears in the book of a given seed.
+
+    Args:
+        poem (SoftPoem): The poem to render
+        seed (int): The book's seed
+        batched (bool): Whether to draw the markup decisions in
+            vectorized batches. See `SoftPoem.render_markups()`.
+        timer (RenderTimer): Timer to record the rendering phases in
+
+    Returns:
+        str: The body of the poem in HTML
+    """
+    rng = SeededRandom(poem_seed(seed, poem.immutable_id))
+    return poem.get(rng, batched, timer)
+
+
+def _render_in_worker(immutable_ids, seed, batched, timed, version):
+    registry.require_version(version)
+    timer = RenderTimer() if timed else NULL_TIMER
+    bodies = [render_poem(registry.get_poem(immutable_id), seed, batched,
+                          timer)
+              for immutable_id in immutable_ids]
+    return bodies, timer if timed else None
+
+
+def get_poem_pool(workers):
+    """
+    Get the process-wide poem pool, creating it if needed.
+
+    Args:
+        workers (int): The number of processes to create the pool with
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a server which may already be running threads isn't
+            # safe, so workers start from scratch and build their own
+            # registry of poems
+            _pool = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def render_poems(poems, seed, batched=False, timer=NULL_TIMER, workers=0):
+    """
+    Render a book's poems in order.
+
+    Args:
+        poems (Iterable[SoftPoem]): The poems, in the order they appear
+        seed (int): The book's seed
+        batched (bool): Whether to draw the markup decisions in
+            vectorized batches. See `SoftPoem.render_markups()`.
+        timer (RenderTimer): Timer to record the rendering phases in.
+            With a pool, each phase holds the time spent in it across
+            every worker.
+        workers (int): If above 0, render the poems concurrently across a
+            pool of this many processes. Each worker renders a run of
+            consecutive poems with the same poems as this process (see
+            `registry.require_version()`), and any run a worker can't is
+            rendered here instead.
+
+    Yields:
+        tuple[SoftPoem, str]: Each poem, with its rendered body, in order.
+        Without a pool, poems are rendered lazily as they are requested.
+    """
+    if not workers:
+        for poem in poems:
+            yield poem, render_poem(poem, seed, batched, timer)
+        return
+    poems = list(poems)
+    timed = timer is not NULL_TIMER
+    version = corpus_version()
+    run_length = -(-len(poems) // workers)
+    runs = [poems[start:start + run_length]
+            for start in range(0, len(poems), run_length)]
+    pool = get_poem_pool(workers)
+    futures = [pool.submit(_render_in_worker,
+                           [poem.immutable_id for poem in run], seed,
+                           batched, timed, version)
+               for run in runs]
+    for run, future in zip(runs, futures):
+        try:
+            bodies, worker_timer = future.result()
+        except registry.StaleCorpusError:
+            for poem in run:
+                yield poem, render_poem(poem, seed, batched, timer)
+            continue
+        if timed:
+            timer.merge(worker_timer)
+        yield from zip(run, bodies)
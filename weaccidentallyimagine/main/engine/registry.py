@@ -0,0 +1,176 @@
+"""The registry of all of the poems in the book, built once per process.
+
+`load()` is called when the Django app starts (see `apps.py`), after which
+every request shares the same immutable tuple of poems. When `poems.py` or
+a text is edited, `reload()` rebuilds just the poems which changed and
+swaps them in, without restarting the process (see `corpus_watcher.py`).
+"""
+
+import importlib
+import threading
+
+from . import corpus
+from . import poems as poems_config
+from .seeded_random import SeededRandom
+from .soft_poem import SoftPoem
+
+# The poems in use, by order and by ID, the `poems.py` entry each was built
+# from, and the digests of the files they were built from. Replaced as a
+# whole, so readers always see a consistent set.
+_state = None
+_lock = threading.Lock()
+
+
+def build_poem(config):
+    """
+    Build one poem from its entry in `poems.py`.
+
+    The poem's attributes are drawn from a random source seeded with its
+    `immutable_id`, so every process builds it identically.
+
+    Args:
+        config (dict): The poem's entry in `poems.py`
+
+    Returns:
+        SoftPoem
+    """
+    return SoftPoem(rng=SeededRandom(config['immutable_id']), **config)
+
+
+def build_poems():
+    """
+    Build every poem described in `poems.py`.
+
+    Returns:
+        tuple[SoftPoem]
+    """
+    return tuple(build_poem(config) for config in poems_config.poems)
+
+
+def _publish(poems, configs, digests):
+    global _state
+    # Compile every table now rather than on a request
+    for poem in poems:
+        poem.transition_table()
+    _state = (poems, {poem.immutable_id: poem for poem in poems},
+              configs, digests)
+    # Only bump the version once the poems it describes are in use, so
+    # nothing stored under the new version is rendered from the old poems
+    corpus.set_corpus_hash(corpus.compute_corpus_hash(digests))
+
+
+def load():
+    """
+    Build the registry if it hasn't been built yet.
+
+    Returns:
+        tuple[SoftPoem]: All of the poems in the book
+    """
+    with _lock:
+        if _state is None:
+            digests = corpus.source_digests()
+            configs = list(poems_config.poems)
+            _publish(tuple(build_poem(config) for config in configs),
+                     configs, digests)
+    return _state[0]
+
+
+def reload():
+    """
+    Rebuild the poems whose entry in `poems.py` or text has changed.
+
+    Unchanged poems are kept as they are. Changed ones are built, along
+    with their transition tables, before anything is swapped, and then all
+    of the poems are swapped in at once, followed by the new corpus
+    version (see `corpus.py`). If a file changes again while the poems are
+    being built, nothing is swapped, and the next reload picks the change
+    up.
+
+    Returns:
+        bool: Whether any poem changed
+    """
+    if _state is None:
+        load()
+        return False
+    with _lock:
+        poems, poems_by_id, configs, digests = _state
+        new_digests = corpus.source_digests()
+        if new_digests == digests:
+            return False
+        importlib.reload(poems_config)
+        old_configs = {config['immutable_id']: config for config in configs}
+        new_configs = list(poems_config.poems)
+        new_poems = []
+        for config in new_configs:
+            immutable_id = config['immutable_id']
+            filename = config['filename']
+            if (old_configs.get(immutable_id) == config and
+                    new_digests.get(filename) == digests.get(filename)):
+                new_poems.append(poems_by_id[immutable_id])
+            else:
+                new_poems.append(build_poem(config))
+        if corpus.source_digests() != new_digests:
+            return False
+        _publish(tuple(new_poems), new_configs, new_digests)
+    return True
+
+
+class StaleCorpusError(Exception):
+    """Raised when a process can't render with the poems it was asked to."""
+
+
+def require_version(version):
+    """
+    Make sure this process renders with the poems of a corpus version.
+
+    Worker processes call this once per task, with the version their parent
+    process renders with. A worker behind its parent reloads the poems it
+    is missing. A worker can't go back to poems which are no longer on
+    disk, though, so if it is still on another version after reloading,
+    the parent has to render the task itself.
+
+    Args:
+        version (str): The corpus version to render with (see
+            `corpus.corpus_version()`)
+
+    Raises:
+        StaleCorpusError: If this process can't render with `version`
+    """
+    load()
+    if corpus.corpus_version() == version:
+        return
+    reload()
+    if corpus.corpus_version() != version:
+        raise StaleCorpusError('Asked to render corpus version {}, but the '
+                               'files on disk are of version {}'.format(
+                                   version, corpus.corpus_version()))
+
+
+def get_poems():
+    """
+    Get all of the poems in the book, building the registry if needed.
+
+    Returns:
+        tuple[SoftPoem]
+    """
+    if _state is None:
+        return load()
+    return _state[0]
+
+
+def get_poem(immutable_id):
+    """
+    Get one poem by its ID, building the registry if needed.
+
+    Args:
+        immutable_id (int): The poem's ID
+
+    Returns:
+        SoftPoem
+
+    Raises:
+        KeyError: If no poem has that ID
+    """
+    if _state is None:
+        load()
+    return _state[1][immutable_id]
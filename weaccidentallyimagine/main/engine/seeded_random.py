@@ -0,0 +1,148 @@
+"""A self-contained random source with the weighted operations of `blur.rand`.
+
+`blur.rand` draws exclusively from the global state of the standard `random`
+module, so two books rendered at once in the same process would interleave
+their draws. `SeededRandom` offers the same operations on a private
+`random.Random` state, consuming random numbers in exactly the same way, so
+a book rendered from `SeededRandom(seed)` matches one rendered after
+`random.seed(seed)`.
+"""
+
+import hashlib
+import random
+import warnings
+
+from blur import rand
+
+
+def poem_seed(seed, immutable_id):
+    """
+    Derive the seed of one poem's random source from a book's seed.
+
+    Every poem in a book draws from its own random source, so a poem
+    renders the same way whichever poems are rendered before it, or
+    alongside it in other processes.
+
+    Args:
+        seed (int): The book's seed
+        immutable_id (int): The poem's ID
+
+    Returns:
+        int: A 64-bit seed
+    """
+    digest = hashlib.sha256('{}:{}'.format(seed, immutable_id).encode())
+    return int.from_bytes(digest.digest()[:8], 'big')
+
+
+class SeededRandom(random.Random):
+    """A `random.Random` with `blur.rand`-compatible weighted operations."""
+
+    def prob_bool(self, probability):
+        """
+        Return `True` or `False` depending on `probability`.
+
+        Equivalent to `blur.rand.prob_bool`.
+
+        Args:
+            probability (float): 0-1 probability to return `True`
+
+        Returns: bool
+        """
+        return self.uniform(0, 1) < probability
+
+    def weighted_rand(self, weights, round_result=False):
+        """
+        Generate a non-uniform random value based on a list of weight tuples.
+
+        Equivalent to `blur.rand.weighted_rand`: the weights are treated as
+        points of a piecewise linear probability curve, and points are
+        rolled in the curve's bounding box until one lands under it.
+
+        Args:
+            weights (list[tuple]): `(outcome, strength)` weight tuples
+            round_result (bool): Whether to round the result to an int
+
+        Returns:
+            float or int: A weighted random number
+        """
+        if len(weights) == 1:
+            return weights[0][0]
+        weights = sorted(weights, key=lambda w: w[0])
+        x_min = weights[0][0]
+        x_max = weights[-1][0]
+        y_max = max([point[1] for point in weights])
+        for attempt in range(500000):
+            sample = (self.uniform(x_min, x_max), self.uniform(0, y_max))
+            if rand._point_under_curve(weights, sample):
+                if round_result:
+                    return int(round(sample[0]))
+                else:
+                    return sample[0]
+        warnings.warn(
+            'Point not being found in weighted_rand() after 500000 '
+            'attempts, defaulting to a random weight point.')
+        return self.choice(weights)[0]
+
+    def weighted_choice(self, weights, as_index_and_value_tuple=False):
+        """
+        Pick one outcome from a list of `(outcome, strength)` tuples.
+
+        Equivalent to `blur.rand.weighted_choice`.
+
+        Args:
+            weights (list[tuple]): `(outcome, strength)` option tuples
+            as_index_and_value_tuple (bool): Whether to return an
+                `(index, outcome)` tuple instead of just the outcome
+
+        Returns:
+            Any: The picked outcome, or `(index, outcome)`
+
+        Raises:
+            ValueError: If `weights` is empty
+            blur.rand.ProbabilityUndefinedError: If no strength is above 0
+        """
+        if not len(weights):
+            raise ValueError('Cannot pick from an empty list of weights.')
+        prob_sum = sum(w[1] for w in weights)
+        if prob_sum <= 0:
+            raise rand.ProbabilityUndefinedError(
+                'No item weights are greater than 0.')
+        sample = self.uniform(0, prob_sum)
+        current_pos = 0
+        for i, (outcome, strength) in enumerate(weights):
+            if current_pos <= sample <= current_pos + strength:
+                if as_index_and_value_tuple:
+                    return (i, outcome)
+                else:
+                    return outcome
+            current_pos += strength
+        raise AssertionError('No outcome was picked in weighted_choice().')
+
+    def weighted_order(self, weights):
+        """
+        Order a list of `(item, strength)` tuples by repeated weighted picks.
+
+        Equivalent to `blur.rand.weighted_order`.
+
+        Args:
+            weights (list[tuple]): `(item, strength)` tuples
+
+        Returns:
+            list: The items in their new order
+
+        Raises:
+            blur.rand.ProbabilityUndefinedError: If any strength is 0 or less
+        """
+        if not len(weights):
+            return []
+        if any(w[1] <= 0 for w in weights):
+            raise rand.ProbabilityUndefinedError(
+                'All weight values must be greater than 0.')
+        working_list = weights[:]
+        output_list = []
+        while working_list:
+            index, item = self.weighted_choice(working_list,
+                                               as_index_and_value_tuple=True)
+            output_list.append(item)
+            del working_list[index]
+        return output_list
@@ -1,20 +1,19 @@
+import hashlib
 import os
 
-from blur import rand
 from blur import soft
-from blur.markov.graph import Graph
 
+from .batch_sampling import draw_markups_batched
 from .html_utils import (surround_with_tag, horizontal_blank_space,
                          variable_length_dash, variable_height_break)
-
-# Uncomment to fix the seed for reproducible rendering for debugging
-# import random
-# random.seed(12345)
-
-PUNCTUATIONS = [',', '.', ':', '!', '?', '"', ';']
+from .curve_sampler import CurveSampler
+from .seeded_random import SeededRandom
+from .timing import NULL_TIMER
+from .token_array import TokenArray
+from .transition_table import load_transition_table
+from .vocabulary import DASH, BREAK
 
 SOURCE_DIR = os.path.join(os.path.dirname(__file__), 'texts')
-LINE_LENGTH = 20
 
 _default_mutable_chance       = 0.5
 _default_distance_weights     = {-5: 30, -2: 30,
@@ -49,6 +48,7 @@ class SoftPoem(soft.SoftObject):
                  x_gap_length_weights=None,
                  y_gap_height_weights=None,
                  dash_length_weights=None,
+                 rng=None,
                  ):
         """
         Args:
@@ -84,10 +84,23 @@ class SoftPoem(soft.SoftObject):
             dash_length_weights (list[tuple]): List of weight tuples for
                 the length of dashes triggered by `---` marks in the
                 source text.
+            rng (SeededRandom): The random source used to calculate
+                attributes on init. Pass one with a fixed seed so that
+                every process builds the poem the same way. If `None`,
+                a new unseeded one is used.
         """
         self.immutable_id = immutable_id
         self.title = title
         self.filepath = os.path.join(SOURCE_DIR, filename)
+        # Read and compile the source once, so rendering literal poems
+        # never touches the disk or re-tokenizes the text
+        with open(self.filepath, 'rb') as source_file:
+            source = source_file.read()
+        # Identifies the text this poem was built from, so its transition
+        # table is always compiled from the same text (see
+        # `transition_table()`)
+        self.source_digest = hashlib.sha256(source).hexdigest()
+        self.source_tokens = TokenArray.from_words(source.decode().split())
         self.mutable_chance       = (mutable_chance
                                      if mutable_chance
                                      else _default_mutable_chance)
@@ -109,18 +122,61 @@ class SoftPoem(soft.SoftObject):
         self.dash_length_weights  = (dash_length_weights
                                      if dash_length_weights
                                      else _default_dash_length_weights)
+        # Compile the curves drawn from while rendering, so each draw
+        # takes constant time
+        self.word_count_sampler   = CurveSampler(self.word_count_weights)
+        self.x_gap_length_sampler = CurveSampler(self.x_gap_length_weights)
+        self.y_gap_height_sampler = CurveSampler(self.y_gap_height_weights)
+        self.dash_length_sampler  = CurveSampler(self.dash_length_weights)
         # Some args are used to calculate attributes on init
-        self.gap_before = rand.weighted_rand(
+        if rng is None:
+            rng = SeededRandom()
+        self.gap_before = rng.weighted_rand(
                 gap_before_weights if gap_before_weights
                 else _default_gap_before_weights)
-        self.left_pad = rand.weighted_rand(
+        self.left_pad = rng.weighted_rand(
                 left_pad_weights if left_pad_weights
                 else _default_left_pad_weights)
-        self.x_gap_freq = rand.weighted_rand(
+        self.x_gap_freq = rng.weighted_rand(
                 x_gap_freq_weights if x_gap_freq_weights
                 else _default_x_gap_freq_weights)
 
-    def render_markups(self, word_list):
+    def draw_markups(self, tokens, rng):
+        """
+        Make every random decision needed to render a list of tokens.
+
+        For each token this rolls, in order, the length of a `---` dash or
+        the height of a `|||` break, and then whether (and how wide) an
+        x-axis gap should be inserted before it.
+
+        Args:
+            tokens (TokenArray): The words and markups to be rendered
+            rng (SeededRandom): The random source to draw from.
+
+        Returns:
+            tuple[list, list]: `(markup_sizes, x_gaps)`, each holding one
+            item per token. `markup_sizes` holds the dash length or break
+            height of each markup and `None` for other tokens. `x_gaps`
+            holds the width of the gap to insert before each token, or
+            `None` for no gap.
+        """
+        markup_sizes = []
+        x_gaps = []
+        for kind in tokens.kinds:
+            if kind == DASH:
+                markup_sizes.append(self.dash_length_sampler.sample(rng))
+            elif kind == BREAK:
+                markup_sizes.append(self.y_gap_height_sampler.sample(rng))
+            else:
+                markup_sizes.append(None)
+            # Roll to insert x-axis gaps
+            if rng.prob_bool(self.x_gap_freq):
+                x_gaps.append(self.x_gap_length_sampler.sample(rng))
+            else:
+                x_gaps.append(None)
+        return markup_sizes, x_gaps
+
+    def render_markups(self, word_list, rng, batched=False):
         """
         Render a list of words and markups to html with automatic line breaks.
 
@@ -136,82 +192,106 @@ class SoftPoem(soft.SoftObject):
               in the form `<div class="poem-line"> ... </div>`
 
         Line breaks are triggered after every word which exceeds
-        `LINE_LENGTH`. This character limit ignores HTML tags,
+        `token_array.LINE_LENGTH`. This character limit ignores HTML tags,
         allowing lines containing spans (variable-length-dash or
         horizontal-blank-space) to intentionally visually exceed the apparent
-        right edge of the poem.
+        right edge of the poem. Since it doesn't depend on chance, the
+        positions of line breaks are precomputed in the `TokenArray`.
 
         Args:
-            word_list (list[str]): The list of words (as well as punctuation
-                marks and markups) to render.
+            word_list (TokenArray or Sequence[str]): The words (as well as
+                punctuation marks and markups) to render. Passing a
+                precompiled `TokenArray` saves compiling one here.
+            rng (SeededRandom): The random source to draw from.
+            batched (bool): Whether to make all of the random decisions in
+                a few vectorized draws (see `batch_sampling.py`, requires
+                NumPy) instead of word by word.
 
         Returns:
             str: The contents of `word_list` rendered as HTML
         """
-        working_text = word_list[:]  # Copy of word_list to avoid side-effects
-        lines = []                   # List of lines in the generated poem
-        current_line = []            # List of words in the current line
-        visible_char_count = 0       # Number of visible chars in current line
+        if isinstance(word_list, TokenArray):
+            tokens = word_list
+        else:
+            tokens = TokenArray.from_words(word_list)
+        if batched:
+            markup_sizes, x_gaps = draw_markups_batched(self, tokens, rng)
+        else:
+            markup_sizes, x_gaps = self.draw_markups(tokens, rng)
 
-        for word in working_text:
-            if word == '---':
+        # Start from each token as it appears without any random markup,
+        # then render markups and gaps where they were rolled
+        pieces = list(tokens.spaced)
+        for index, kind in enumerate(tokens.kinds):
+            if kind == DASH:
                 # Render triple dashes to variable length visible dashes
                 # (in the form of inline-block spans)
-                dash_length = rand.weighted_rand(self.dash_length_weights)
-                word = variable_length_dash(dash_length)
-            elif word == '|||':
+                word = variable_length_dash(markup_sizes[index])
+            elif kind == BREAK:
                 # Render triple pipes as variable height breaks
                 # (in the form of fixed-height spans)
-                y_gap = rand.weighted_rand(
-                        self.y_gap_height_weights)
-                word = variable_height_break(y_gap)
+                word = variable_height_break(markup_sizes[index])
+            elif x_gaps[index] is not None:
+                word = tokens.words[index]
             else:
-                # Otherwise, the word will be rendered literally as visible
-                # text, so count it toward the visible character count used
-                # in placing line breaks
-                visible_char_count += len(word)
+                continue
+            if x_gaps[index] is not None:
+                word = horizontal_blank_space(x_gaps[index]) + word
+            # Only bare punctuation marks go without a space before them
+            pieces[index] = ' ' + word
 
-            # Roll to insert x-axis gaps
-            if rand.prob_bool(self.x_gap_freq):
-                x_gap = rand.weighted_rand(self.x_gap_length_weights)
-                # Sometimes place space before word, sometimes after (50/50)
-                word = horizontal_blank_space(x_gap) + word
-            # Break lines when LINE_LENGTH is exceeded
-            if visible_char_count > LINE_LENGTH:
-                visible_char_count = 0
-                lines.append(''.join(current_line))
-                current_line = []
-            # Handle spaces appropriately for punctuation marks
-            if word in PUNCTUATIONS:
-                current_line.append(word)
-            else:
-                current_line.append(' ' + word)
-        # Attach final line
-        if current_line:
-            lines.append(''.join(current_line))
+        return ''.join(surround_with_tag(''.join(pieces[start:end]),
+                                         'div', 'class="poem-line"')
+                       for start, end in tokens.lines())
+
+    def transition_table(self):
+        """
+        Get the Markov transition table of the poem's source text.
+
+        Tables are loaded on first use and cached by the contents of the
+        text the poem was built from (see `load_transition_table()`).
 
-        return (''.join((surround_with_tag(line, 'div', 'class="poem-line"')
-                         for line in lines)))
+        Returns:
+            TransitionTable
+        """
+        return load_transition_table(self.filepath, self.distance_weights,
+                                     self.source_digest)
 
-    def get(self):
+    def get(self, rng=None, batched=False, timer=None):
         """
         Render the poem as an HTML string.
 
+        Args:
+            rng (SeededRandom): The random source to draw from. Pass one
+                seeded with a fixed value for reproducible rendering.
+                If `None`, a new unseeded one is used.
+            batched (bool): Whether to draw the markup decisions in
+                vectorized batches. See `render_markups()`.
+            timer (RenderTimer): If given, the time spent building the
+                Markov model, walking it, and rendering markups is added
+                to it, along with whether this poem rolled mutable.
+
         Returns:
             str: the body of the poem in HTML
         """
-        if rand.prob_bool(self.mutable_chance):
+        if rng is None:
+            rng = SeededRandom()
+        if timer is None:
+            timer = NULL_TIMER
+        mutable = rng.prob_bool(self.mutable_chance)
+        if mutable:
             # Render text from a markov graph derived from the source text
-            word_list = []
-            word_count = rand.weighted_rand(
-                self.word_count_weights, round_result=True)
-            word_graph = Graph.from_file(self.filepath, self.distance_weights)
-            for i in range(word_count):
-                word = word_graph.pick().get_value()
-                word_list.append(word)
+            word_count = self.word_count_sampler.sample(
+                rng, round_result=True)
+            with timer.phase('markov_build'):
+                transition_table = self.transition_table()
+            with timer.phase('markov_walk'):
+                word_list = TokenArray(
+                    transition_table.walk_ids(word_count, rng))
         else:
             # Otherwise, copy source contents literally
-            source_file = open(self.filepath, 'r')
-            word_list = source_file.read().split()
+            word_list = self.source_tokens
+        timer.record_poem(self.immutable_id, mutable, len(word_list))
         # Combine words, process markups, and return HTML
-        return self.render_markups(word_list)
+        with timer.phase('markup'):
+            return self.render_markups(word_list, rng, batched)
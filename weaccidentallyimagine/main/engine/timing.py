@@ -0,0 +1,97 @@
+"""Timing of the phases of rendering a book."""
+
+from contextlib import contextmanager
+import time
+
+
+class RenderTimer:
+    """Accumulates the time spent in each phase of rendering a book.
+
+    A single timer is created per render and passed down to everything
+    which does work worth measuring. It also records, for every poem
+    rendered, whether it rolled mutable and how many words it had.
+
+    Example:
+        >>> timer = RenderTimer()
+        >>> with timer.phase('ordering'):
+        ...     pass
+        >>> list(timer.phases)
+        ['ordering']
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.poems = []
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a block of code, adding the time to the phase `name`.
+
+        Args:
+            name (str): The name of the phase
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (self.phases.get(name, 0) +
+                                 time.perf_counter() - start)
+
+    def record_poem(self, immutable_id, mutable, word_count):
+        """
+        Record the outcome of rendering one poem.
+
+        Args:
+            immutable_id (int): The poem's ID
+            mutable (bool): Whether the poem rolled mutable
+            word_count (int): How many words and markups the poem had
+        """
+        self.poems.append((immutable_id, mutable, word_count))
+
+    def merge(self, other):
+        """
+        Add the phases and poems recorded by another timer to this one.
+
+        Used when part of a render happens elsewhere, such as in a worker
+        process with its own timer.
+
+        Args:
+            other (RenderTimer): The timer to merge in
+        """
+        for name, seconds in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0) + seconds
+        self.poems.extend(other.poems)
+
+    def elapsed(self):
+        """
+        Get the time since the timer was created.
+
+        Returns:
+            float: Elapsed seconds
+        """
+        return time.perf_counter() - self.started
+
+
+class _NullPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullTimer:
+    """A `RenderTimer` stand-in which records nothing."""
+
+    _null_phase = _NullPhase()
+
+    def phase(self, name):
+        return self._null_phase
+
+    def record_poem(self, immutable_id, mutable, word_count):
+        pass
+
+
+NULL_TIMER = NullTimer()
@@ -0,0 +1,120 @@
+"""Precompiled token arrays for rendering poems.
+
+A `TokenArray` holds a poem's words together with everything about them
+which doesn't depend on chance: which tokens are markups or punctuation,
+how each plain token is spaced in the rendered line, and where line breaks
+fall. Literal poems are compiled once at startup, so rendering them only
+has to roll the random gaps, dashes and breaks.
+
+Tokens are stored as IDs in the corpus-wide vocabulary (see
+`vocabulary.py`), which already knows each token's kind and spacing, so
+compiling a token array takes no string handling at all.
+"""
+
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+from .vocabulary import get_vocabulary
+
+LINE_LENGTH = 20
+
+
+def line_breaks(visible_prefix, line_length=LINE_LENGTH):
+    """
+    Find the tokens which start new lines.
+
+    A line is broken before every token which takes the visible character
+    count of its line past `line_length`. That token then starts a line
+    whose count begins again from zero, not counting the token itself.
+
+    Args:
+        visible_prefix (Sequence[int]): Prefix sums of the visible
+            characters of each token, starting with 0
+        line_length (int): The visible characters allowed per line
+
+    Returns:
+        list[int]: Indices of the tokens which start new lines
+
+    Example:
+        >>> line_breaks([0, 10, 20, 25, 30, 40], line_length=20)
+        [2]
+    """
+    breaks = []
+    base = 0
+    token_count = len(visible_prefix) - 1
+    while True:
+        index = bisect_right(visible_prefix, base + line_length) - 1
+        if index >= token_count:
+            return breaks
+        breaks.append(index)
+        base = visible_prefix[index + 1]
+
+
+class TokenArray:
+    """A sequence of words and markups compiled for rendering.
+
+    Attributes:
+        ids (array): The vocabulary ID of each token
+        words (tuple[str]): The tokens themselves, as interned in the
+            vocabulary
+        kinds (array): The kind of each token (`WORD`, `PUNCTUATION`,
+            `DASH` or `BREAK`)
+        spaced (tuple[str]): Each plain token as it appears in a line when
+            no gap is inserted before it. `None` for markups.
+        visible_prefix (array): Prefix sums of the visible characters of
+            each token, starting with 0. Markups have no visible characters.
+        line_breaks (tuple[int]): Indices of the tokens which start new
+            lines (see `line_breaks()`)
+    """
+
+    def __init__(self, ids):
+        """
+        Args:
+            ids (Iterable[int]): The vocabulary ID of each word,
+                punctuation mark and markup
+        """
+        vocabulary = get_vocabulary()
+        self.ids = array('i', ids)
+        words = vocabulary.words
+        kinds = vocabulary.kinds
+        spaced = vocabulary.spaced
+        visible_lengths = vocabulary.visible_lengths
+        self.words = tuple([words[word_id] for word_id in self.ids])
+        self.kinds = array('b', [kinds[word_id] for word_id in self.ids])
+        self.spaced = tuple([spaced[word_id] for word_id in self.ids])
+        self.visible_prefix = array('l', [0])
+        self.visible_prefix.extend(accumulate(
+            [visible_lengths[word_id] for word_id in self.ids]))
+        self.line_breaks = tuple(line_breaks(self.visible_prefix))
+
+    @classmethod
+    def from_words(cls, words):
+        """
+        Compile a token array from token strings, interning any new ones.
+
+        Args:
+            words (Iterable[str]): The words, punctuation marks and markups
+
+        Returns:
+            TokenArray
+        """
+        return cls(get_vocabulary().encode(words))
+
+    def __len__(self):
+        return len(self.words)
+
+    def lines(self):
+        """
+        Get the `(start, end)` token range of every rendered line.
+
+        The first line may be empty, if the very first token is too long to
+        fit in a line. No other line is ever empty.
+
+        Returns:
+            list[tuple[int, int]]
+        """
+        if not self.words:
+            return []
+        bounds = (0,) + self.line_breaks + (len(self.words),)
+        return list(zip(bounds, bounds[1:]))
@@ -0,0 +1,266 @@
+"""Precompiled, array-backed Markov transition tables for mutable poems.
+
+A `TransitionTable` holds the same graph `blur.markov.graph.Graph.from_file`
+derives from a source text (one state per word position, linked to other
+positions according to a dict of distance weights), but flattened into
+integer arrays so that it can be built once per process and walked without
+touching any per-node Python objects. Tokens are stored as IDs in the
+corpus-wide vocabulary (see `vocabulary.py`), which every table shares.
+"""
+
+from array import array
+from bisect import bisect_left
+import hashlib
+from itertools import accumulate
+import random
+import re
+
+from .vocabulary import get_vocabulary
+
+# Bump whenever a change to tokenizing or linking alters the table a text
+# compiles to, so stored tables are compiled again (see `model_store.py`)
+TOKENIZER_VERSION = 1
+
+# The tokenizing expression used by `blur.markov.graph.Graph.from_string`
+# with its default `<<` and `>>` group markers
+TOKEN_EXPRESSION = re.compile(r'\<\<(.+)\>\>|([^\w\s]+)\B|([\S]+\b)')
+
+
+def tokenize(source):
+    """
+    Split a source text into words and punctuation marks the way blur does.
+
+    Args:
+        source (str): The text to tokenize
+
+    Returns:
+        list[str]: The tokens found in `source`, in order
+
+    Example:
+        >>> tokenize('hello, world')
+        ['hello', ',', 'world']
+    """
+    return [next(group for group in match if group)
+            for match in TOKEN_EXPRESSION.findall(source)]
+
+
+class TransitionTable:
+    """A distance-weighted Markov graph compiled to flat arrays.
+
+    State `i` is the `i`th token of the source text. The outgoing links of
+    state `i` occupy the slice `offsets[i]:offsets[i + 1]` of `targets` and
+    `cumulative`, where `targets` holds the destination states and
+    `cumulative` holds running sums of the link weights, so that each step
+    of a walk is a single bisect.
+    """
+
+    def __init__(self, vocabulary, tokens, offsets, targets, cumulative,
+                 totals):
+        """
+        Args:
+            vocabulary (Vocabulary): The vocabulary `tokens` refer to
+            tokens (array): The vocabulary ID of the token at each state
+            offsets (array): Start of each state's links in `targets` and
+                `cumulative`, with one trailing entry marking the end
+            targets (array): The destination state of every link
+            cumulative (array): Running sum of link weights within each
+                state's slice
+            totals (array): The total outgoing link weight of each state
+        """
+        self.vocabulary = vocabulary
+        self.tokens = tokens
+        self.offsets = offsets
+        self.targets = targets
+        self.cumulative = cumulative
+        self.totals = totals
+
+    def __len__(self):
+        return len(self.tokens)
+
+    @classmethod
+    def from_string(cls, source, distance_weights):
+        """
+        Compile a transition table from a source string.
+
+        Links are built exactly as `Graph.from_string` builds them with
+        `merge_same_words=False`: every token links to the token `key`
+        positions away (wrapping around the text) with weight
+        `distance_weights[key]`, keys are visited in sorted order, and
+        links which land on the same position are merged by summing their
+        weights.
+
+        Links only ever land on the same position in texts shorter than the
+        span of the distance weights. In any longer text, every state has
+        the same links shifted along the text, so the table is built in a
+        single pass over the tokens without merging anything.
+
+        Args:
+            source (str): The text to derive the table from
+            distance_weights (dict): Dict of relative indices to weights
+
+        Returns:
+            TransitionTable
+        """
+        vocabulary = get_vocabulary()
+        tokens = vocabulary.encode(tokenize(source))
+
+        sorted_weights = sorted(distance_weights.items())
+        word_count = len(tokens)
+        keys = [key for key, weight in sorted_weights]
+        if keys and word_count and len(
+                {key % word_count for key in keys}) == len(keys):
+            link_count = len(keys)
+            running_sums = list(accumulate(
+                weight for key, weight in sorted_weights))
+            offsets = array('l', range(0, word_count * link_count + 1,
+                                       link_count))
+            targets = array('l', [(key + index) % word_count
+                                  for index in range(word_count)
+                                  for key in keys])
+            cumulative = array('d', running_sums * word_count)
+            totals = array('d', running_sums[-1:] * word_count)
+            return cls(vocabulary, tokens, offsets, targets, cumulative,
+                       totals)
+
+        offsets = array('l', [0])
+        targets = array('l')
+        cumulative = array('d')
+        totals = array('d')
+        for index in range(word_count):
+            # Merge links to the same position, keeping first-seen order
+            links = {}
+            for key, weight in sorted_weights:
+                target = (key + index) % word_count
+                links[target] = links.get(target, 0) + weight
+            running_sum = 0
+            for target, weight in links.items():
+                running_sum += weight
+                targets.append(target)
+                cumulative.append(running_sum)
+            totals.append(sum(links.values()))
+            offsets.append(len(targets))
+        return cls(vocabulary, tokens, offsets, targets, cumulative, totals)
+
+    @classmethod
+    def from_file(cls, path, distance_weights):
+        """
+        Compile a transition table from a text file.
+
+        Args:
+            path (str): Path to the source text
+            distance_weights (dict): Dict of relative indices to weights
+
+        Returns:
+            TransitionTable
+        """
+        with open(path, 'r') as source_file:
+            return cls.from_string(source_file.read(), distance_weights)
+
+    def step(self, state, rng=random):
+        """
+        Pick the state following `state`.
+
+        This draws from `rng` exactly as `blur.rand.weighted_choice` would
+        when called on the links of the equivalent graph node.
+
+        Args:
+            state (int): The current state
+            rng (random.Random): The random source to draw from
+
+        Returns:
+            int: The next state
+        """
+        start = self.offsets[state]
+        end = self.offsets[state + 1]
+        sample = rng.uniform(0, self.totals[state])
+        index = bisect_left(self.cumulative, sample, start, end)
+        # Guard against float summation differences at the top edge
+        return self.targets[min(index, end - 1)]
+
+    def walk_ids(self, count, rng=random):
+        """
+        Take a random walk of `count` tokens through the table.
+
+        The first state is picked uniformly, as `Graph.pick` does for a
+        graph with no current node.
+
+        Args:
+            count (int): The number of tokens to generate
+            rng (random.Random): The random source to draw from
+
+        Returns:
+            array: The vocabulary ID of each generated token
+        """
+        ids = array('i')
+        if count <= 0:
+            return ids
+        tokens = self.tokens
+        state = rng.randrange(len(tokens))
+        ids.append(tokens[state])
+        for i in range(count - 1):
+            state = self.step(state, rng)
+            ids.append(tokens[state])
+        return ids
+
+    def walk(self, count, rng=random):
+        """
+        Take a random walk of `count` tokens through the table.
+
+        Draws exactly as `walk_ids()` does.
+
+        Args:
+            count (int): The number of tokens to generate
+            rng (random.Random): The random source to draw from
+
+        Returns:
+            list[str]: The generated tokens
+        """
+        words = self.vocabulary.words
+        return [words[word_id] for word_id in self.walk_ids(count, rng)]
+
+
+_table_cache = {}
+
+
+def load_transition_table(path, distance_weights, source_digest=None):
+    """
+    Get the transition table for a source file, compiling it on first use.
+
+    Tables are cached for the lifetime of the process, keyed by the
+    contents of the source text and its distance weights (see
+    `model_store.model_key()`). If the compiled corpus file of the current
+    corpus version (see `compiled_corpus.py`) holds the table, it is taken
+    from there. Otherwise it is taken from the model store if it was stored
+    before, or else compiled and stored (see `model_store.py`).
+
+    Args:
+        path (str): Path to the source text
+        distance_weights (dict): Dict of relative indices to weights
+        source_digest (Optional[str]): The hex SHA-256 digest of the text
+            as the caller read it. Read from `path` if not given.
+
+    Returns:
+        TransitionTable
+
+    Raises:
+        ValueError: If the table has to be compiled, but the text at
+            `path` no longer matches `source_digest`
+    """
+    # Imported here since the compiled corpus and the model store are
+    # built from this module
+    from .compiled_corpus import get_compiled_corpus
+    from .model_store import get_model_store, model_key
+    if source_digest is None:
+        with open(path, 'rb') as source_file:
+            source_digest = hashlib.sha256(source_file.read()).hexdigest()
+    key = model_key(source_digest, distance_weights)
+    table = _table_cache.get(key)
+    if table is None:
+        compiled_corpus = get_compiled_corpus()
+        if compiled_corpus is not None:
+            table = compiled_corpus.tables.get(key)
+        if table is None:
+            table = get_model_store().load(path, distance_weights,
+                                           source_digest)
+        _table_cache[key] = table
+    return table
@@ -0,0 +1,145 @@
+"""The corpus-wide vocabulary of interned tokens.
+
+The texts share much of their vocabulary ("we", "the", punctuation marks,
+`|||` markups and so on). Rather than every transition table and token
+array holding strings of its own, each distinct token is interned once in
+the process-wide `Vocabulary` returned by `get_vocabulary()`, and referred
+to everywhere else by its integer ID. The vocabulary also holds what each
+token looks like in a rendered line, so token arrays are compiled from IDs
+with plain array lookups rather than string comparisons.
+
+The vocabulary starts out holding every token of the texts, in a fixed
+order, so every process running the same corpus gives each token the same
+ID (compiled corpus files rely on this, see `compiled_corpus.py`). Tokens
+from anywhere else are added as they are met.
+"""
+
+from array import array
+import os
+import threading
+
+# Token kinds
+WORD = 0
+PUNCTUATION = 1
+DASH = 2
+BREAK = 3
+
+PUNCTUATIONS = [',', '.', ':', '!', '?', '"', ';']
+
+_MARKUP_KINDS = {'---': DASH, '|||': BREAK}
+
+
+class Vocabulary:
+    """An append-only table of distinct tokens, each with an integer ID.
+
+    Attributes:
+        words (list[str]): The token with each ID
+        kinds (array): The kind of each token (`WORD`, `PUNCTUATION`,
+            `DASH` or `BREAK`)
+        spaced (list[str]): Each plain token as it appears in a line when
+            no gap is inserted before it. `None` for markups.
+        visible_lengths (array): The visible characters of each token.
+            Markups have none.
+    """
+
+    def __init__(self, words=()):
+        """
+        Args:
+            words (Iterable[str]): Tokens to intern, in order
+        """
+        self.words = []
+        self.kinds = array('b')
+        self.spaced = []
+        self.visible_lengths = array('l')
+        self._ids = {}
+        self._lock = threading.Lock()
+        self.encode(words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def intern(self, word):
+        """
+        Get the ID of a token, adding the token if it is new.
+
+        Args:
+            word (str): The token
+
+        Returns:
+            int
+        """
+        word_id = self._ids.get(word)
+        if word_id is not None:
+            return word_id
+        with self._lock:
+            word_id = self._ids.get(word)
+            if word_id is None:
+                kind = _MARKUP_KINDS.get(word)
+                if kind is None:
+                    kind = PUNCTUATION if word in PUNCTUATIONS else WORD
+                    self.spaced.append(
+                        word if kind == PUNCTUATION else ' ' + word)
+                    self.visible_lengths.append(len(word))
+                else:
+                    self.spaced.append(None)
+                    self.visible_lengths.append(0)
+                self.kinds.append(kind)
+                word_id = len(self.words)
+                self.words.append(word)
+                # Published last, so no reader can find the ID of a token
+                # whose attributes aren't all stored yet
+                self._ids[word] = word_id
+        return word_id
+
+    def encode(self, words):
+        """
+        Intern a sequence of tokens.
+
+        Args:
+            words (Iterable[str]): The tokens
+
+        Returns:
+            array: The ID of each token
+        """
+        return array('i', map(self.intern, words))
+
+
+def build_vocabulary():
+    """
+    Build a vocabulary of every token in the texts.
+
+    Each text is interned both split on whitespace, as literal poems are,
+    and tokenized the way transition tables are.
+
+    Returns:
+        Vocabulary
+    """
+    # Imported here since both modules depend on this one
+    from .soft_poem import SOURCE_DIR
+    from .transition_table import tokenize
+    vocabulary = Vocabulary()
+    for filename in sorted(os.listdir(SOURCE_DIR)):
+        with open(os.path.join(SOURCE_DIR, filename), 'r') as source_file:
+            source = source_file.read()
+        vocabulary.encode(source.split())
+        vocabulary.encode(tokenize(source))
+    return vocabulary
+
+
+_vocabulary = None
+_lock = threading.Lock()
+
+
+def get_vocabulary():
+    """
+    Get the process-wide vocabulary, building it on first use.
+
+    Returns:
+        Vocabulary
+    """
+    global _vocabulary
+    if _vocabulary is None:
+        with _lock:
+            if _vocabulary is None:
+                _vocabulary = build_vocabulary()
+    return _vocabulary
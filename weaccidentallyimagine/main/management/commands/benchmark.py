@@ -0,0 +1,256 @@
+"""Benchmark the rendering engine and the main view.
+
+Every case runs offline with fixed seeds. Results hold latency
+distributions and allocation figures for each case, and are written as
+JSON so that two runs can be compared:
+
+    $ python manage.py benchmark --output before.json
+    $ python manage.py benchmark --compare before.json
+"""
+
+import copy
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+
+from blur import rand
+from blur.markov.graph import Graph
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from main.engine import registry
+from main.engine.corpus import ENGINE_VERSION, corpus_version
+from main.engine.seeded_random import SeededRandom
+from main.engine.transition_table import TransitionTable
+
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = min(len(sorted_values) - 1,
+                max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(timings):
+    """
+    Summarize a list of latencies.
+
+    Args:
+        timings (list[float]): Latencies in seconds
+
+    Returns:
+        dict: Count, mean, and distribution of the latencies in milliseconds
+    """
+    timings = sorted(timing * 1000 for timing in timings)
+    return {
+        'count': len(timings),
+        'mean_ms': statistics.mean(timings),
+        'min_ms': timings[0],
+        'p50_ms': _percentile(timings, 0.5),
+        'p90_ms': _percentile(timings, 0.9),
+        'p99_ms': _percentile(timings, 0.99),
+        'max_ms': timings[-1],
+    }
+
+
+def measure(function, iterations, seed):
+    """
+    Time a function and measure its memory allocations.
+
+    `function` is called with a fresh `SeededRandom` for every iteration,
+    seeded with `seed + iteration`, so results are repeatable. Timing and
+    allocation tracing happen in separate passes, so tracing doesn't
+    inflate the latencies.
+
+    Args:
+        function (callable): Function taking a `SeededRandom`
+        iterations (int): How many timed calls to make
+        seed (int): The seed for the first iteration
+
+    Returns:
+        dict: The latency summary (see `summarize()`) along with the peak
+        traced memory and the number of allocated blocks still live after
+        a single call
+    """
+    timings = []
+    for iteration in range(iterations):
+        rng = SeededRandom(seed + iteration)
+        start = time.perf_counter()
+        function(rng)
+        timings.append(time.perf_counter() - start)
+    result = summarize(timings)
+
+    rng = SeededRandom(seed)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    function(rng)
+    after = tracemalloc.take_snapshot()
+    result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    result['allocated_bytes'] = sum(max(stat.size_diff, 0) for stat in stats)
+    result['allocated_blocks'] = sum(max(stat.count_diff, 0)
+                                     for stat in stats)
+    return result
+
+
+def _with_mutable_chance(poem, mutable_chance):
+    """Copy a poem, forcing which branch of `SoftPoem.get` it takes."""
+    forced_poem = copy.copy(poem)
+    forced_poem.mutable_chance = mutable_chance
+    return forced_poem
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the poem rendering engine and the main view, '
+            'writing the results as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=20,
+            help='Timed iterations per benchmark case (default 20).')
+        parser.add_argument(
+            '--seed', type=int, default=12345,
+            help='Seed of the first iteration of every case.')
+        parser.add_argument(
+            '--output', default='benchmark_results.json',
+            help='Path to write the JSON results to.')
+        parser.add_argument(
+            '--compare', metavar='BASELINE',
+            help='Path to earlier JSON results to check for regressions.')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Fractional increase in median latency counted as a '
+                 'regression when comparing (default 0.2).')
+        parser.add_argument(
+            '--only', action='append', metavar='PREFIX',
+            help='Only run cases whose names start with PREFIX. '
+                 'May be given more than once.')
+
+    def cases(self):
+        """
+        Build every benchmark case.
+
+        Yields:
+            tuple[str, callable]: Each case's name and its function, which
+            takes a `SeededRandom`
+        """
+        poems = registry.get_poems()
+        for poem in poems:
+            yield ('render_markups/{}'.format(poem.immutable_id),
+                   lambda rng, poem=poem:
+                       poem.render_markups(poem.source_tokens, rng))
+        for poem in poems:
+            literal_poem = _with_mutable_chance(poem, 0)
+            yield ('get_literal/{}'.format(poem.immutable_id),
+                   lambda rng, poem=literal_poem: poem.get(rng))
+        for poem in poems:
+            mutable_poem = _with_mutable_chance(poem, 1)
+            yield ('get_mutable/{}'.format(poem.immutable_id),
+                   lambda rng, poem=mutable_poem: poem.get(rng))
+        for poem in poems:
+            filename = os.path.basename(poem.filepath)
+            yield ('graph_from_file/{}'.format(filename),
+                   lambda rng, poem=poem: Graph.from_file(
+                       poem.filepath, poem.distance_weights))
+            yield ('transition_table_from_file/{}'.format(filename),
+                   lambda rng, poem=poem: TransitionTable.from_file(
+                       poem.filepath, poem.distance_weights))
+        x_gap_length_sampler = poems[0].x_gap_length_sampler
+        yield ('weighted_rand/seeded_random',
+               lambda rng: rng.weighted_rand(x_gap_length_sampler.weights))
+        yield ('weighted_rand/curve_sampler',
+               lambda rng: x_gap_length_sampler.sample(rng))
+        position_weights = [(poem, poem.position_weight) for poem in poems]
+
+        def blur_weighted_order(rng):
+            random.seed(rng.random())
+            rand.weighted_order(position_weights)
+        yield ('weighted_order/blur', blur_weighted_order)
+        yield ('weighted_order/seeded_random',
+               lambda rng: rng.weighted_order(position_weights))
+
+        client = Client()
+
+        def main_view(rng):
+            response = client.get('/{}'.format(rng.randrange(10 ** 18)))
+            if response.status_code != 200:
+                raise CommandError('main_view responded with status {}'
+                                   .format(response.status_code))
+            if response.streaming:
+                b''.join(response.streaming_content)
+        yield ('main_view', main_view)
+
+    def handle(self, *args, **options):
+        # Render every page from scratch, and let the test client in
+        with override_settings(RENDER_CACHE_MAX_BYTES=0,
+                               ALLOWED_HOSTS=['testserver']):
+            results = {}
+            for name, function in self.cases():
+                if options['only'] and not any(
+                        name.startswith(prefix) for prefix in options['only']):
+                    continue
+                results[name] = measure(function, options['iterations'],
+                                        options['seed'])
+                self.stdout.write('{:<50} p50 {:>9.3f} ms  p99 {:>9.3f} ms'
+                                  .format(name, results[name]['p50_ms'],
+                                          results[name]['p99_ms']))
+        report = {
+            'meta': {
+                'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'engine_version': ENGINE_VERSION,
+                'corpus_version': corpus_version(),
+                'iterations': options['iterations'],
+                'seed': options['seed'],
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+        self.stdout.write('Wrote results to {}'.format(options['output']))
+
+        if options['compare']:
+            self.compare(options['compare'], results, options['threshold'])
+
+    def compare(self, baseline_path, results, threshold):
+        """
+        Compare results to a baseline, failing if any case regressed.
+
+        Args:
+            baseline_path (str): Path to earlier JSON results
+            results (dict): The results of this run
+            threshold (float): Fractional increase in median latency
+                counted as a regression
+
+        Raises:
+            CommandError: If any case's median latency regressed
+        """
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = []
+        for name, result in sorted(results.items()):
+            if name not in baseline:
+                continue
+            before = baseline[name]['p50_ms']
+            after = result['p50_ms']
+            change = (after - before) / before if before else 0
+            if change > threshold:
+                regressions.append(name)
+                flag = 'REGRESSED'
+            elif change < -threshold:
+                flag = 'improved'
+            else:
+                flag = ''
+            self.stdout.write('{:<50} {:>9.3f} -> {:>9.3f} ms ({:+.1%}) {}'
+                              .format(name, before, after, change, flag))
+        if regressions:
+            raise CommandError('{} case(s) regressed by more than {:.0%}: {}'
+                               .format(len(regressions), threshold,
+                                       ', '.join(regressions)))
@@ -0,0 +1,176 @@
+"""Render fixed-seed books into a static site which needs no Python to serve.
+
+    $ python manage.py build_static_site 0-9999 --output site/
+
+The site is laid out so any static file server or CDN can serve it:
+
+    site/index.html         picks one of the books at random and goes there
+    site/<seed>/index.html  the book at `/<seed>`, exactly as rendered there
+    site/static/...         the static assets, with content hashes in their
+                            names so they can be cached forever
+    site/robots.txt         the same rules as the live site's
+    site/manifest.jsonl     what was rendered, as `render_books` records it
+
+Books are skipped as `render_books` skips them: only those already in the
+manifest with the current page version and year, so an interrupted build
+can simply be started again and more seeds can be added to a site later,
+while books which no longer match `/<seed>`, after switching
+`BATCH_MARKUP_SAMPLING` or once the year has changed, are built again. The
+root page picks from every current book in the manifest. Assets are
+collected again on every build, and those of earlier builds kept, so every
+book keeps the assets it was built with.
+"""
+
+import json
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.management.base import CommandError
+from django.template import loader
+from django.templatetags.static import static
+from django.test import RequestFactory
+from django.urls import resolve
+
+from main.management.commands import render_books
+from main.management.commands.render_books import read_manifest, write_book
+from main.views import render_book
+
+STATIC_DIR = 'static'
+STYLESHEET = 'main/css/main.css'
+
+
+def collect_static(output_dir):
+    """
+    Copy every static asset into the site, fingerprinted.
+
+    Assets are written under `<output_dir>/static/` by Django's
+    `ManifestStaticFilesStorage`, which adds a hash of each file's contents
+    to its name and points the URLs within stylesheets at the hashed
+    names.
+
+    Args:
+        output_dir (str): The site's directory
+
+    Returns:
+        dict[str, str]: The fingerprinted URL of each asset, keyed by the
+        URL pages link to it by
+    """
+    storage = ManifestStaticFilesStorage(
+        location=os.path.join(output_dir, STATIC_DIR),
+        base_url=settings.STATIC_URL)
+    found = {}
+    for finder in finders.get_finders():
+        for path, source_storage in finder.list(['CVS', '.*', '*~']):
+            if path in found:
+                continue
+            # Assets under their hashed names from earlier builds are kept,
+            # so books built then still find theirs
+            if storage.exists(path):
+                storage.delete(path)
+            with source_storage.open(path) as source_file:
+                storage.save(path, source_file)
+            found[path] = (storage, path)
+    for original, processed, done in storage.post_process(found):
+        if isinstance(done, Exception):
+            raise CommandError('Could not fingerprint {}: {}'
+                               .format(original, done))
+    # Hashed names are used even when DEBUG is on
+    return {static(path): storage.url(path, force=True) for path in found}
+
+
+def fingerprint_links(page, asset_urls):
+    """
+    Point a page's links to static assets at their fingerprinted names.
+
+    Args:
+        page (str): A rendered page
+        asset_urls (dict[str, str]): Fingerprinted asset URLs, as returned
+            by `collect_static()`
+
+    Returns:
+        str
+    """
+    for url, fingerprinted_url in asset_urls.items():
+        page = page.replace('"{}"'.format(url),
+                            '"{}"'.format(fingerprinted_url))
+    return page
+
+
+def seed_runs(seeds):
+    """
+    Group seeds into runs of consecutive seeds.
+
+    Args:
+        seeds (Iterable[int]): The seeds
+
+    Returns:
+        list[list]: The first seed, as a string, and the length of each
+        run, in order
+
+    Example:
+        >>> seed_runs([7, 3, 4, 5])
+        [['3', 3], ['7', 1]]
+    """
+    runs = []
+    last = None
+    for seed in sorted(set(seeds)):
+        if last is not None and seed == last + 1:
+            runs[-1][1] += 1
+        else:
+            runs.append([str(seed), 1])
+        last = seed
+    return runs
+
+
+def render_to_site(seed, output_dir, current_year, asset_urls):
+    """
+    Render one fixed-seed book into the site.
+
+    Args:
+        seed (int): The book's seed
+        output_dir (str): The site's directory
+        current_year (int): The year to print in the prelude
+        asset_urls (dict[str, str]): Fingerprinted asset URLs, as returned
+            by `collect_static()`
+
+    Returns:
+        dict: The book's manifest entry
+    """
+    page = fingerprint_links(render_book(None, seed, True, current_year),
+                             asset_urls).encode()
+    return write_book(output_dir, os.path.join(str(seed), 'index.html'),
+                      seed, page, page)
+
+
+class Command(render_books.Command):
+    help = ('Render fixed-seed books into a static site, with fingerprinted '
+            'assets and a root page picking a random book.')
+
+    render_to = staticmethod(render_to_site)
+
+    def prepare(self, output_dir):
+        self.asset_urls = collect_static(output_dir)
+        self.stdout.write('Collected {} static assets.'.format(
+            len(self.asset_urls)))
+        return (self.asset_urls,)
+
+    def finish(self, output_dir, version, year):
+        self._write_root(output_dir, read_manifest(output_dir, version, year),
+                         self.asset_urls)
+        self.stdout.write('Wrote the site to {}'.format(output_dir))
+
+    def _write_root(self, output_dir, seeds, asset_urls):
+        page = loader.render_to_string('main/static_index.html', {
+            'stylesheet_url': asset_urls[static(STYLESHEET)],
+            'seed_runs': json.dumps(seed_runs(seeds)),
+            'first_seed': min(seeds),
+        })
+        with open(os.path.join(output_dir, 'index.html'), 'w') as root_file:
+            root_file.write(page)
+        # Serve the same robots.txt as the live site does
+        robots = resolve('/robots.txt').func(
+            RequestFactory().get('/robots.txt'))
+        with open(os.path.join(output_dir, 'robots.txt'), 'wb') as robots_file:
+            robots_file.write(robots.content)
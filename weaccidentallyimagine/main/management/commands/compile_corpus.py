@@ -0,0 +1,33 @@
+"""Compile every poem's transition table into a memory-mappable file.
+
+    $ python manage.py compile_corpus
+
+The file is written to `main/engine/compiled/`, named after the corpus
+version and file format, where every process serving or rendering the site
+maps it rather than compiling its own tables (see
+`main/engine/compiled_corpus.py`). Run it again after changing the engine,
+`poems.py` or any of the texts. Every table is also kept in the model store
+(`main/engine/compiled/models/`, see `main/engine/model_store.py`), so only
+the tables of texts or distance weights which changed are compiled again.
+"""
+
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.engine.compiled_corpus import CompiledCorpus, compile_corpus
+
+
+class Command(BaseCommand):
+    help = ('Compile the transition tables of every poem into a versioned '
+            'corpus file which server processes map into memory.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        path = compile_corpus()
+        corpus = CompiledCorpus(path)
+        self.stdout.write('Wrote {} tables ({:.1f} KiB) to {} in {:.2f} s.'
+                          .format(len(corpus.tables),
+                                  os.path.getsize(path) / 1024, path,
+                                  time.perf_counter() - start))
@@ -0,0 +1,391 @@
+"""Generate load against a running server and report how it held up.
+
+    $ python manage.py load_test http://127.0.0.1:8000 --requests 1000
+    $ python manage.py load_test http://127.0.0.1:8000 --replay access.log
+
+Requests are made over a few keep-alive connections at once, each sending
+its next request as soon as the last one is answered, so the report shows
+how many books a second the server keeps up with. Requests either mix
+random books (`/`) and fixed-seed books (`/<seed>`) in a given ratio, or
+replay the book requests found in an access log, in order. Throughput,
+latency percentiles and error rates are written as JSON, overall and for
+each kind of request.
+
+Only the standard library is used to make requests, so any local server
+(`manage.py runserver`, gunicorn, uvicorn...) can be tested as it is.
+"""
+
+import asyncio
+import datetime
+import json
+import random
+import re
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.engine.corpus import corpus_version
+from main.management.commands.benchmark import summarize
+
+# The requested path of a line in the common or combined log format, or
+# logged by `manage.py runserver`
+LOG_REQUEST_EXPRESSION = re.compile(r'"(?:GET|HEAD) (\S+) HTTP/[0-9.]+"')
+
+# Book routes, by the name they are reported under (see `urls.py`)
+ROUTE_EXPRESSIONS = (
+    ('random', re.compile(r'^/$')),
+    ('fixed', re.compile(r'^/[0-9]+$')),
+)
+
+
+def route_of(path):
+    """
+    Get the kind of book a path requests.
+
+    Args:
+        path (str): A request path, without a query string
+
+    Returns:
+        Optional[str]: `'random'` or `'fixed'`, or `None` if the path isn't
+        a book route
+    """
+    for route, expression in ROUTE_EXPRESSIONS:
+        if expression.match(path):
+            return route
+    return None
+
+
+def read_access_log(path):
+    """
+    Find the book requests in an access log.
+
+    Args:
+        path (str): Path to the log
+
+    Returns:
+        tuple[list[str], int]: The paths of the book requests, in order,
+        and how many other requests were skipped
+    """
+    paths = []
+    skipped = 0
+    with open(path) as log_file:
+        for line in log_file:
+            match = LOG_REQUEST_EXPRESSION.search(line)
+            if not match:
+                continue
+            request_path = match.group(1).split('?', 1)[0]
+            if route_of(request_path) is None:
+                skipped += 1
+            else:
+                paths.append(request_path)
+    return paths, skipped
+
+
+def mixed_paths(count, root_ratio, seed, distinct_seeds=0):
+    """
+    Generate a mix of random and fixed-seed book requests.
+
+    Args:
+        count (int): How many paths to generate
+        root_ratio (float): 0-1 fraction of requests for a random book
+        seed (int): Seed for the choice of requests, so that runs are
+            repeatable
+        distinct_seeds (int): If above 0, fixed-seed requests only ask for
+            this many different books, so some are repeated as popular
+            books would be
+
+    Returns:
+        list[str]
+    """
+    rng = random.Random(seed)
+    if distinct_seeds:
+        book_seeds = [rng.randrange(10 ** 18) for i in range(distinct_seeds)]
+    paths = []
+    for i in range(count):
+        if rng.random() < root_ratio:
+            paths.append('/')
+        elif distinct_seeds:
+            paths.append('/{}'.format(rng.choice(book_seeds)))
+        else:
+            paths.append('/{}'.format(rng.randrange(10 ** 18)))
+    return paths
+
+
+class Connection:
+    """A keep-alive HTTP/1.1 connection to the server under test."""
+
+    def __init__(self, host, port, use_ssl, headers):
+        """
+        Args:
+            host (str): Server host name
+            port (int): Server port
+            use_ssl (bool): Whether to connect over TLS
+            headers (dict): Extra headers to send with every request
+        """
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.headers = headers
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.reader = self.writer = None
+
+    async def get(self, path):
+        """
+        Request a path and read the whole response.
+
+        Args:
+            path (str): The path to request
+
+        Returns:
+            tuple[int, int]: The response status and the size of its body
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port, ssl=self.use_ssl or None)
+        lines = ['GET {} HTTP/1.1'.format(path),
+                 'Host: {}:{}'.format(self.host, self.port)]
+        lines.extend('{}: {}'.format(name, value)
+                     for name, value in self.headers.items())
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await self.writer.drain()
+
+        # Interim 1xx responses come before the final one, and are skipped
+        status = 100
+        while 100 <= status < 200:
+            status, headers = await self._read_head()
+
+        if status in (204, 304):
+            # These never have a body, whatever their headers say
+            size = 0
+        elif 'content-length' in headers:
+            size = int(headers['content-length'])
+            await self.reader.readexactly(size)
+        elif headers.get('transfer-encoding') == 'chunked':
+            size = 0
+            while True:
+                chunk_size = int((await self.reader.readline()).split(b';')[0],
+                                 16)
+                await self.reader.readexactly(chunk_size + 2)
+                size += chunk_size
+                if not chunk_size:
+                    break
+        else:
+            # Without a length, the body runs until the server hangs up
+            size = len(await self.reader.read())
+            headers['connection'] = 'close'
+        if headers.get('connection') == 'close':
+            await self.close()
+        return status, size
+
+    async def _read_head(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Server closed the connection')
+        parts = status_line.split()
+        if len(parts) < 2:
+            raise ValueError('Malformed status line: {!r}'.format(status_line))
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        return status, headers
+
+
+async def run_load(target, paths, concurrency, duration=None, headers=None):
+    """
+    Request paths over several connections at once.
+
+    Args:
+        target (str): Base URL of the server, e.g. `http://127.0.0.1:8000`
+        paths (list[str]): The paths to request, in order
+        concurrency (int): How many requests to have in flight at once
+        duration (Optional[float]): If given, stop after this many seconds
+            even if paths are left
+        headers (Optional[dict]): Extra headers to send with every request
+
+    Returns:
+        tuple[list[tuple], float]: `(path, status, size, seconds)` of every
+        request made, with a status of `None` for requests which failed
+        without a response, and the time the run took in seconds
+    """
+    url = urlsplit(target)
+    use_ssl = url.scheme == 'https'
+    port = url.port or (443 if use_ssl else 80)
+    pending = iter(paths)
+    results = []
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+
+    async def worker():
+        connection = Connection(url.hostname, port, use_ssl, headers or {})
+        try:
+            for path in pending:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                request_start = time.perf_counter()
+                try:
+                    status, size = await connection.get(path)
+                except (OSError, ValueError, asyncio.IncompleteReadError):
+                    await connection.close()
+                    status, size = None, 0
+                results.append((path, status, size,
+                                time.perf_counter() - request_start))
+        finally:
+            await connection.close()
+
+    await asyncio.gather(*(worker() for i in range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+def report_results(results, elapsed):
+    """
+    Summarize requests made by `run_load()`.
+
+    Args:
+        results (list[tuple]): `(path, status, size, seconds)` of every
+            request
+        elapsed (float): The time the requests took in seconds
+
+    Returns:
+        dict: Throughput, error rate, response statuses and the latency
+        summary (see `benchmark.summarize()`) of the requests
+    """
+    statuses = {}
+    errors = 0
+    for path, status, size, seconds in results:
+        key = str(status) if status is not None else 'failed'
+        statuses[key] = statuses.get(key, 0) + 1
+        if status is None or status >= 400:
+            errors += 1
+    report = {
+        'requests': len(results),
+        'errors': errors,
+        'error_rate': errors / len(results) if results else 0,
+        'throughput_rps': len(results) / elapsed if elapsed else 0,
+        'bytes': sum(result[2] for result in results),
+        'statuses': statuses,
+    }
+    if results:
+        report.update(summarize([result[3] for result in results]))
+    return report
+
+
+class Command(BaseCommand):
+    help = ('Generate load of random and fixed-seed books against a running '
+            'server, writing throughput and latency as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'target', help='Base URL of the server, e.g. '
+                           'http://127.0.0.1:8000')
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='How many requests to make (default 500). Ignored when '
+                 'replaying.')
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Requests in flight at once (default 8).')
+        parser.add_argument(
+            '--duration', type=float,
+            help='Stop after this many seconds even if requests are left.')
+        parser.add_argument(
+            '--root-ratio', type=float, default=0.5,
+            help='Fraction of requests for a random book at / rather than '
+                 'a fixed-seed book (default 0.5).')
+        parser.add_argument(
+            '--distinct-seeds', type=int, default=0,
+            help='Only request this many different fixed-seed books, so '
+                 'some are requested again. 0 requests a new book every '
+                 'time (default).')
+        parser.add_argument(
+            '--seed', type=int, default=12345,
+            help='Seed for choosing which books to request.')
+        parser.add_argument(
+            '--replay', metavar='LOG',
+            help='Request the books found in an access log, in order, '
+                 'instead of a generated mix.')
+        parser.add_argument(
+            '--accept-encoding', default='gzip',
+            help='Accept-Encoding header to send (default gzip).')
+        parser.add_argument(
+            '--output', default='load_test_results.json',
+            help='Path to write the JSON results to.')
+
+    def handle(self, *args, **options):
+        if not urlsplit(options['target']).hostname:
+            raise CommandError('Invalid target URL: {}'
+                               .format(options['target']))
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+        skipped = 0
+        if options['replay']:
+            paths, skipped = read_access_log(options['replay'])
+            if not paths:
+                raise CommandError('No book requests found in {}'
+                                   .format(options['replay']))
+        else:
+            if not 0 <= options['root_ratio'] <= 1:
+                raise CommandError('--root-ratio must be between 0 and 1')
+            paths = mixed_paths(options['requests'], options['root_ratio'],
+                                options['seed'], options['distinct_seeds'])
+        headers = {}
+        if options['accept_encoding']:
+            headers['Accept-Encoding'] = options['accept_encoding']
+
+        results, elapsed = asyncio.run(run_load(
+            options['target'], paths, options['concurrency'],
+            options['duration'], headers))
+
+        routes = {}
+        for route, expression in ROUTE_EXPRESSIONS:
+            route_results = [result for result in results
+                             if route_of(result[0]) == route]
+            if route_results:
+                routes[route] = report_results(route_results, elapsed)
+                self.stdout.write(
+                    '{:<8} {:>6} requests {:>8.1f}/s  p50 {:>9.3f} ms  '
+                    'p99 {:>9.3f} ms  errors {:.1%}'.format(
+                        route, routes[route]['requests'],
+                        routes[route]['throughput_rps'],
+                        routes[route]['p50_ms'], routes[route]['p99_ms'],
+                        routes[route]['error_rate']))
+        overall = report_results(results, elapsed)
+        self.stdout.write('{:<8} {:>6} requests {:>8.1f}/s in {:.2f} s'
+                          .format('overall', overall['requests'],
+                                  overall['throughput_rps'], elapsed))
+        report = {
+            'meta': {
+                'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+                'target': options['target'],
+                'concurrency': options['concurrency'],
+                'replay': options['replay'],
+                'replay_skipped': skipped,
+                'root_ratio': (None if options['replay']
+                               else options['root_ratio']),
+                'distinct_seeds': options['distinct_seeds'],
+                'seed': options['seed'],
+                'duration_s': elapsed,
+                # The version of this checkout, which should match the
+                # server's for the results to describe it
+                'corpus_version': corpus_version(),
+            },
+            'overall': overall,
+            'routes': routes,
+        }
+        with open(options['output'], 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+        self.stdout.write('Wrote results to {}'.format(options['output']))
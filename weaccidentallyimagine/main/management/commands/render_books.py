@@ -0,0 +1,257 @@
+"""Render many fixed-seed books to compressed files across a process pool.
+
+    $ python manage.py render_books 0-9999 --output books/
+    $ python manage.py render_books --seed-file seeds.txt --output books/
+
+Each book is written to `<output>/<seed>.html.gz`, exactly as it would be
+served from `/<seed>`, and recorded in `<output>/manifest.jsonl`. Seeds
+already in the manifest with the current page version (see
+`views.page_version()`) and year are skipped, so an interrupted run can
+simply be started again. Books rendered in another mode, or before the
+year changed, no longer match `/<seed>` and are rendered again.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main.render_pool import init_worker
+from main.views import page_version, render_book
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def parse_seeds(specs):
+    """
+    Expand seed arguments into a list of seeds.
+
+    Args:
+        specs (list[str]): Seeds, or inclusive ranges of seeds like `0-99`
+
+    Returns:
+        list[int]
+
+    Raises:
+        CommandError: If a spec isn't a seed or a range
+
+    Example:
+        >>> parse_seeds(['3', '7-9'])
+        [3, 7, 8, 9]
+    """
+    seeds = []
+    for spec in specs:
+        try:
+            if '-' in spec:
+                first, last = spec.split('-')
+                seeds.extend(range(int(first), int(last) + 1))
+            else:
+                seeds.append(int(spec))
+        except ValueError:
+            raise CommandError('Invalid seed or seed range: {}'.format(spec))
+    return seeds
+
+
+def read_manifest(output_dir, version, year):
+    """
+    Find the seeds already rendered into an output directory.
+
+    Args:
+        output_dir (str): The output directory
+        version (str): The current page version (see
+            `views.page_version()`). Books rendered with any other version
+            are not counted.
+        year (int): The current year. Books printing any other year are
+            not counted.
+
+    Returns:
+        set[int]: Seeds whose books exist for `version` and `year`
+    """
+    done = set()
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as manifest:
+            for line in manifest:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interruption
+                    continue
+                if (entry['version'] == version and
+                        entry['year'] == year and os.path.exists(
+                            os.path.join(output_dir, entry['file']))):
+                    done.add(entry['seed'])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def write_book(output_dir, filename, seed, page, data):
+    """
+    Write a rendered book into an output directory.
+
+    The file is written under a temporary name first, so an interrupted
+    run never leaves a partial book behind.
+
+    Args:
+        output_dir (str): The output directory
+        filename (str): The book's path within `output_dir`
+        seed (int): The book's seed
+        page (bytes): The rendered page
+        data (bytes): What to write, `page` or an encoding of it
+
+    Returns:
+        dict: The book's manifest entry
+    """
+    path = os.path.join(output_dir, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'wb') as book_file:
+        book_file.write(data)
+    os.replace(temp_path, path)
+    return {
+        'seed': seed,
+        'file': filename,
+        'bytes': len(page),
+        'sha256': hashlib.sha256(page).hexdigest(),
+    }
+
+
+def render_to_file(seed, output_dir, current_year):
+    """
+    Render one fixed-seed book and write it compressed.
+
+    Args:
+        seed (int): The book's seed
+        output_dir (str): Directory to write `<seed>.html.gz` into
+        current_year (int): The year to print in the prelude
+
+    Returns:
+        dict: The book's manifest entry
+    """
+    page = render_book(None, seed, True, current_year).encode()
+    return write_book(output_dir, '{}.html.gz'.format(seed), seed, page,
+                      gzip.compress(page, mtime=0))
+
+
+def _run_job(job):
+    function, args = job
+    return function(*args)
+
+
+class Command(BaseCommand):
+    """Renders seeds into a directory, one file per book.
+
+    Other bulk rendering commands subclass this one, replacing
+    `render_to()` to write their books differently, and `prepare()` and
+    `finish()` to write whatever else their output needs.
+    """
+
+    help = ('Render fixed-seed books to gzipped HTML files with a manifest, '
+            'using a pool of processes.')
+
+    # Renders one book into the output directory. Called in the workers
+    # with the seed, the output directory, the year to print, and the
+    # arguments returned by `prepare()`, and returns the book's manifest
+    # entry. It must be a module-level function, so that it can be handed
+    # to a worker process.
+    render_to = staticmethod(render_to_file)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'seeds', nargs='*',
+            help='Seeds to render, or inclusive ranges such as 0-999.')
+        parser.add_argument(
+            '--seed-file',
+            help='File listing seeds (or ranges) to render, one per line.')
+        parser.add_argument(
+            '--output', required=True,
+            help='Directory to write books and the manifest into.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Number of rendering processes (default: one per CPU).')
+        parser.add_argument(
+            '--chunk-size', type=int, default=16,
+            help='Seeds handed to a worker at a time (default 16).')
+
+    def prepare(self, output_dir):
+        """
+        Set up the output directory before any book is rendered.
+
+        Args:
+            output_dir (str): The output directory
+
+        Returns:
+            tuple: Extra arguments to pass to `render_to()`
+        """
+        return ()
+
+    def finish(self, output_dir, version, year):
+        """
+        Finish the output directory once every book is rendered.
+
+        Args:
+            output_dir (str): The output directory
+            version (str): The page version the books were rendered with
+            year (int): The year the books print
+        """
+
+    def handle(self, *args, **options):
+        specs = list(options['seeds'])
+        if options['seed_file']:
+            with open(options['seed_file']) as seed_file:
+                specs.extend(line.strip() for line in seed_file
+                             if line.strip())
+        # Drop repeated seeds, keeping the order they were given in
+        seeds = list(dict.fromkeys(parse_seeds(specs)))
+        if not seeds:
+            raise CommandError('No seeds to render.')
+
+        output_dir = options['output']
+        os.makedirs(output_dir, exist_ok=True)
+        extra_args = self.prepare(output_dir)
+        version = page_version()
+        current_year = timezone.now().year
+        done = read_manifest(output_dir, version, current_year)
+        todo = [seed for seed in seeds if seed not in done]
+        self.stdout.write('{} books to render, {} already done.'.format(
+            len(todo), len(seeds) - len(todo)))
+
+        start = time.perf_counter()
+        rendered = 0
+        jobs = ((self.render_to, (seed, output_dir, current_year) + extra_args)
+                for seed in todo)
+        manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        with open(manifest_path, 'a') as manifest:
+            if options['workers'] > 1:
+                executor = ProcessPoolExecutor(options['workers'],
+                                               initializer=init_worker)
+                results = executor.map(_run_job, jobs,
+                                       chunksize=options['chunk_size'])
+            else:
+                executor = None
+                results = map(_run_job, jobs)
+            try:
+                for entry in results:
+                    entry['version'] = version
+                    entry['year'] = current_year
+                    manifest.write(json.dumps(entry) + '\n')
+                    manifest.flush()
+                    rendered += 1
+                    if rendered % 100 == 0:
+                        self._report(rendered, len(todo), start)
+            finally:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+        self._report(rendered, len(todo), start)
+        self.finish(output_dir, version, current_year)
+
+    def _report(self, rendered, total, start):
+        elapsed = time.perf_counter() - start
+        rate = rendered / elapsed if elapsed else 0
+        self.stdout.write('{}/{} books in {:.1f}s ({:.1f} books/s)'.format(
+            rendered, total, elapsed, rate))
@@ -0,0 +1,264 @@
+"""Aggregated render metrics, exposed in the Prometheus text format.
+
+Each render's `RenderTimer` is folded into process-wide histograms and
+counters by `observe_render()`. `render_prometheus()` formats everything
+for the `/metrics` route.
+"""
+
+from bisect import bisect_left
+import threading
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5)
+# Upper bounds of the poem word count histogram buckets
+WORD_COUNT_BUCKETS = (10, 25, 50, 100, 150, 200, 300, 500, 1000)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, value) for name, value in labels))
+
+
+class Histogram:
+    """A Prometheus-style cumulative histogram, split by label values."""
+
+    def __init__(self, name, help_text, buckets, label_names=()):
+        """
+        Args:
+            name (str): The metric name
+            help_text (str): The metric's description
+            buckets (tuple[float]): Increasing bucket upper bounds
+            label_names (tuple[str]): Names of the labels observations
+                are split by
+        """
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        """
+        Record one observation.
+
+        Args:
+            value (float): The observed value
+            label_values (str): One value for each of `label_names`
+        """
+        series = self._series.get(label_values)
+        if series is None:
+            # Counts for each bucket plus +Inf, then the sum of values
+            series = self._series[label_values] = [0] * (
+                len(self.buckets) + 1) + [0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        """
+        Format the histogram in the Prometheus text format.
+
+        Returns:
+            list[str]: Lines of output
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.help_text),
+                 '# TYPE {} histogram'.format(self.name)]
+        for label_values, series in sorted(self._series.items()):
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, _format_labels(labels + [('le', bound)]),
+                    cumulative))
+            lines.append('{}_sum{} {}'.format(
+                self.name, _format_labels(labels), series[-1]))
+            lines.append('{}_count{} {}'.format(
+                self.name, _format_labels(labels), cumulative))
+        return lines
+
+
+class Counter:
+    """A Prometheus-style counter, split by label values."""
+
+    def __init__(self, name, help_text, label_names=()):
+        """
+        Args:
+            name (str): The metric name
+            help_text (str): The metric's description
+            label_names (tuple[str]): Names of the labels counts are
+                split by
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series = {}
+
+    def increment(self, *label_values, amount=1):
+        """
+        Add to the counter.
+
+        Args:
+            label_values (str): One value for each of `label_names`
+            amount (float): How much to add
+        """
+        self._series[label_values] = (self._series.get(label_values, 0) +
+                                      amount)
+
+    def render(self):
+        """
+        Format the counter in the Prometheus text format.
+
+        Returns:
+            list[str]: Lines of output
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.help_text),
+                 '# TYPE {} counter'.format(self.name)]
+        for label_values, value in sorted(self._series.items()):
+            lines.append('{}{} {}'.format(
+                self.name,
+                _format_labels(list(zip(self.label_names, label_values))),
+                value))
+        return lines
+
+
+class Gauge:
+    """A Prometheus-style gauge: a single value which goes up and down."""
+
+    def __init__(self, name, help_text):
+        """
+        Args:
+            name (str): The metric name
+            help_text (str): The metric's description
+        """
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def set(self, value):
+        """
+        Replace the gauge's value.
+
+        Args:
+            value (float): The new value
+        """
+        self.value = value
+
+    def render(self):
+        """
+        Format the gauge in the Prometheus text format.
+
+        Returns:
+            list[str]: Lines of output
+        """
+        return ['# HELP {} {}'.format(self.name, self.help_text),
+                '# TYPE {} gauge'.format(self.name),
+                '{} {}'.format(self.name, self.value)]
+
+
+_lock = threading.Lock()
+
+render_seconds = Histogram(
+    'book_render_seconds',
+    'Time spent rendering a whole book.',
+    LATENCY_BUCKETS, ('cache',))
+phase_seconds = Histogram(
+    'book_render_phase_seconds',
+    'Time spent in each phase of rendering a book.',
+    LATENCY_BUCKETS, ('phase',))
+poem_word_count = Histogram(
+    'book_poem_word_count',
+    'Words and markups in each rendered poem.',
+    WORD_COUNT_BUCKETS, ('mutable',))
+poem_renders = Counter(
+    'book_poem_renders_total',
+    'Poems rendered, by poem and by whether they rolled mutable.',
+    ('poem', 'mutable'))
+
+book_queue_depth = Gauge(
+    'book_queue_depth',
+    'Random books rendered ahead of time and waiting to be served.')
+book_queue_pops = Counter(
+    'book_queue_pops_total',
+    'Requests for a random book, by whether one was ready in the queue.',
+    ('ready',))
+
+METRICS = [render_seconds, phase_seconds, poem_word_count, poem_renders,
+           book_queue_depth, book_queue_pops]
+
+
+def observe_render(timer, cache_status='miss'):
+    """
+    Fold a finished render's timings into the process-wide metrics.
+
+    Args:
+        timer (RenderTimer): The timer of the finished render
+        cache_status (str): `'hit'` if the page came from the render cache,
+            `'miss'` if it was rendered, `'none'` if it isn't cacheable,
+            `'not_modified'` if the client already held the page,
+            `'queued'` if it was taken from the random book queue,
+            `'background'` if it was rendered ahead of time for that queue,
+            or `'batch'` if it was rendered for the batch API
+    """
+    with _lock:
+        render_seconds.observe(timer.elapsed(), cache_status)
+        for phase, seconds in timer.phases.items():
+            phase_seconds.observe(seconds, phase)
+        for immutable_id, mutable, word_count in timer.poems:
+            mutable_label = 'true' if mutable else 'false'
+            poem_word_count.observe(word_count, mutable_label)
+            poem_renders.increment(str(immutable_id), mutable_label)
+
+
+def observe_book_queue(depth, ready=None):
+    """
+    Record the random book queue's depth, and whether a book was ready.
+
+    Args:
+        depth (int): How many books are now waiting in the queue
+        ready (Optional[bool]): Whether a request found a book ready, or
+            `None` if the queue was refilled rather than popped from
+    """
+    with _lock:
+        book_queue_depth.set(depth)
+        if ready is not None:
+            book_queue_pops.increment('true' if ready else 'false')
+
+
+def server_timing(timer):
+    """
+    Format a render's timings as the value of a `Server-Timing` header.
+
+    Args:
+        timer (RenderTimer): The timer of a finished render
+
+    Returns:
+        str: e.g. `'ordering;dur=0.12, markup;dur=8.53, total;dur=10.2'`,
+        with durations in milliseconds. Poems which rolled mutable are
+        listed in a final `mutable` entry.
+    """
+    entries = ['{};dur={:.3f}'.format(phase, seconds * 1000)
+               for phase, seconds in timer.phases.items()]
+    entries.append('total;dur={:.3f}'.format(timer.elapsed() * 1000))
+    mutable_ids = [str(immutable_id)
+                   for immutable_id, mutable, word_count in timer.poems
+                   if mutable]
+    if mutable_ids:
+        entries.append('mutable;desc="{}"'.format(' '.join(mutable_ids)))
+    return ', '.join(entries)
+
+
+def render_prometheus():
+    """
+    Format every metric in the Prometheus text format.
+
+    Returns:
+        str
+    """
+    with _lock:
+        lines = []
+        for metric in METRICS:
+            lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,180 @@
+"""A precompiled, template-free assembler for the poem page.
+
+Most of the poem page is static, and the rest is a handful of simple
+values. At startup, `PageAssembler.from_templates()` renders the page's
+templates once with placeholder values and splits the output around the
+placeholders. Assembling a page is then a join of static chunks and
+formatted values, which produces exactly the bytes Django's template
+engine would.
+"""
+
+import re
+import weakref
+
+from django.template import Context, loader
+from django.template.base import render_value_in_context
+from django.utils.safestring import mark_safe
+
+# Placeholders are wrapped in NUL characters, which the templates never contain
+_SLOT_PATTERN = re.compile('\x00([a-z_]+)\x00')
+
+
+def _slot(name):
+    return mark_safe('\x00{}\x00'.format(name))
+
+
+class _PlaceholderPoem:
+    """Stands in for a `SoftPoem` while templates are split into chunks."""
+    left_pad = _slot('left_pad')
+    gap_before = _slot('gap_before')
+    immutable_id = _slot('immutable_id')
+    title = _slot('title')
+
+
+def _split_rendered(rendered):
+    """
+    Split rendered template output around its placeholders.
+
+    Returns:
+        list[str]: Alternating static chunks and slot names, starting and
+        ending with a (possibly empty) static chunk
+    """
+    return _SLOT_PATTERN.split(rendered)
+
+
+def _fill(parts, values):
+    """
+    Fill the slots of split template output.
+
+    Args:
+        parts (list[str]): Output of `_split_rendered()`
+        values (dict): Formatted values for every slot in `parts`. Slots
+            without a value are left as slots.
+
+    Returns:
+        list[str]: `parts`, with adjacent static chunks joined
+    """
+    filled = ['']
+    for index, part in enumerate(parts):
+        if index % 2 and part not in values:
+            filled.extend((part, ''))
+        else:
+            filled[-1] += values[part] if index % 2 else part
+    return filled
+
+
+class PageAssembler:
+    """Assembles the poem page from static chunks and a few values."""
+
+    def __init__(self, fixed_head, random_head, article, foot):
+        """
+        Args:
+            fixed_head (list[str]): Split head of the page for fixed seeds
+            random_head (list[str]): Split head of the page for random seeds
+            article (list[str]): Split template of a single poem
+            foot (list[str]): Split foot of the page
+        """
+        self.heads = {True: fixed_head, False: random_head}
+        self.article = article
+        self.foot = foot
+        self._context = Context(autoescape=True)
+        self._article_cache = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_templates(cls):
+        """
+        Build an assembler from the page's templates.
+
+        Returns:
+            PageAssembler
+        """
+        head_template = loader.get_template('main/poem_page_head.html')
+        article_template = loader.get_template('main/poem_article.html')
+        foot_template = loader.get_template('main/poem_page_foot.html')
+        context = {
+            'seed': _slot('seed'),
+            'current_year': _slot('current_year'),
+            'poem': _PlaceholderPoem(),
+            'poem_body': _slot('poem_body'),
+        }
+        return cls(
+            _split_rendered(head_template.render(dict(context,
+                                                      is_fixed=True))),
+            _split_rendered(head_template.render(dict(context,
+                                                      is_fixed=False))),
+            _split_rendered(article_template.render(context)),
+            _split_rendered(foot_template.render(context)))
+
+    def _format(self, value):
+        """Format a value exactly as a `{{ variable }}` tag would."""
+        return render_value_in_context(value, self._context)
+
+    def _article_parts(self, poem):
+        """Get the split article template with `poem`'s values filled in."""
+        parts = self._article_cache.get(poem)
+        if parts is None:
+            parts = _fill(self.article, {
+                'left_pad': self._format(poem.left_pad),
+                'gap_before': self._format(poem.gap_before),
+                'immutable_id': self._format(poem.immutable_id),
+                'title': self._format(poem.title),
+            })
+            self._article_cache[poem] = parts
+        return parts
+
+    def _join(self, parts, values):
+        return ''.join(values[part] if index % 2 else part
+                       for index, part in enumerate(parts))
+
+    def iter_page(self, seed, is_fixed, current_year, rendered_poems):
+        """
+        Assemble the page piece by piece.
+
+        Args:
+            seed (int): The seed for this version of the book
+            is_fixed (bool): Whether the seed came from the URL
+            current_year (int): The year to print in the prelude
+            rendered_poems (Iterable[tuple[SoftPoem, str]]): Each poem in
+                order, with its rendered body. This is consumed lazily.
+
+        Yields:
+            str: The head of the page, then each poem's article, then the
+            foot of the page
+        """
+        values = {
+            'seed': self._format(seed),
+            'current_year': self._format(current_year),
+        }
+        yield self._join(self.heads[bool(is_fixed)], values)
+        for poem, poem_body in rendered_poems:
+            values['poem_body'] = self._format(mark_safe(poem_body))
+            yield self._join(self._article_parts(poem), values)
+        yield self._join(self.foot, values)
+
+    def assemble(self, seed, is_fixed, current_year, rendered_poems):
+        """
+        Assemble the whole page.
+
+        Takes the same arguments as `iter_page()`.
+
+        Returns:
+            str: The rendered page
+        """
+        return ''.join(self.iter_page(seed, is_fixed, current_year,
+                                      rendered_poems))
+
+
+_page_assembler = None
+
+
+def get_page_assembler():
+    """
+    Get the process-wide page assembler, building it on first use.
+
+    Returns:
+        PageAssembler
+    """
+    global _page_assembler
+    if _page_assembler is None:
+        _page_assembler = PageAssembler.from_templates()
+    return _page_assembler
@@ -0,0 +1,276 @@
+"""A size-bounded LRU cache of rendered pages, with optional disk spill."""
+
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+
+from .compression import IDENTITY, GZIP, BROTLI
+
+# The spill file suffix of each encoding of a page
+SPILL_SUFFIXES = {IDENTITY: '.html', GZIP: '.html.gz', BROTLI: '.html.br'}
+
+
+class RenderCache:
+    """An in-memory LRU cache of rendered pages bounded by total size.
+
+    Keys are tuples of simple values (see `page_cache_key()`), values are
+    dicts holding a rendered page in each of its encodings (see
+    `compression.compress_page()`), so that pages are compressed once
+    rather than for every response. The size of a page is the total size
+    of its encodings. When the cache grows beyond `max_bytes`, the least
+    recently used pages are evicted. If `directory` is set, evicted pages
+    are written there and read back on a later miss. When the directory
+    grows beyond `max_spill_bytes`, the pages in it which were least
+    recently spilled or read are deleted. Pages of an old engine or corpus
+    version are never read again, so they are the first to go.
+    """
+
+    def __init__(self, max_bytes, directory=None, max_spill_bytes=0):
+        """
+        Args:
+            max_bytes (int): Largest total size of the pages held in memory
+            directory (Optional[str]): Directory to spill evicted pages to
+            max_spill_bytes (int): Largest total size of the pages in
+                `directory`, or 0 for no limit
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_spill_bytes = max_spill_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._spill_bytes = 0
+        self._spill_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._spill_bytes = sum(
+                size for _, size in _spilled_pages(directory).values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _spill_path(self, key, encoding):
+        name = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, name + SPILL_SUFFIXES[encoding])
+
+    def get(self, key):
+        """
+        Look up a page, falling back to the spill directory on a miss.
+
+        Args:
+            key (tuple): The page's cache key
+
+        Returns:
+            Optional[dict[str, bytes]]: The cached page's encodings, or
+            `None` if not cached
+        """
+        with self._lock:
+            page = self._entries.get(key)
+            if page is not None:
+                self._entries.move_to_end(key)
+                return page
+        if not self.directory:
+            return None
+        page = {}
+        for encoding in SPILL_SUFFIXES:
+            try:
+                with open(self._spill_path(key, encoding), 'rb') as spill_file:
+                    page[encoding] = spill_file.read()
+            except FileNotFoundError:
+                pass
+        if IDENTITY not in page:
+            return None
+        self._touch(key)
+        self.set(key, page)
+        return page
+
+    def set(self, key, page):
+        """
+        Store a page, evicting least recently used pages to make room.
+
+        Pages larger than the whole cache are not stored in memory.
+
+        Args:
+            key (tuple): The page's cache key
+            page (dict[str, bytes]): The rendered page's encodings, which
+                must include `IDENTITY`
+        """
+        if _page_size(page) > self.max_bytes:
+            self._spill(key, page)
+            return
+        evicted = []
+        with self._lock:
+            old_page = self._entries.pop(key, None)
+            if old_page is not None:
+                self.current_bytes -= _page_size(old_page)
+            self._entries[key] = page
+            self.current_bytes += _page_size(page)
+            while self.current_bytes > self.max_bytes:
+                evicted_key, evicted_page = self._entries.popitem(last=False)
+                self.current_bytes -= _page_size(evicted_page)
+                evicted.append((evicted_key, evicted_page))
+        for evicted_key, evicted_page in evicted:
+            self._spill(evicted_key, evicted_page)
+
+    def _spill(self, key, page):
+        if not self.directory:
+            return
+        if os.path.exists(self._spill_path(key, IDENTITY)):
+            self._touch(key)
+            return
+        # The raw page is written last, since readers take its presence to
+        # mean the page's other encodings are all written
+        for encoding in sorted(page, key=lambda name: name == IDENTITY):
+            path = self._spill_path(key, encoding)
+            # Write to a temporary file first so readers never see
+            # partial pages
+            temp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+            with open(temp_path, 'wb') as spill_file:
+                spill_file.write(page[encoding])
+            os.replace(temp_path, path)
+        if not self.max_spill_bytes:
+            return
+        with self._spill_lock:
+            self._spill_bytes += _page_size(page)
+            if self._spill_bytes > self.max_spill_bytes:
+                self._prune()
+
+    def _touch(self, key):
+        # The raw page's modification time records when the page was last
+        # used, so the least recently used pages are pruned first
+        try:
+            os.utime(self._spill_path(key, IDENTITY))
+        except FileNotFoundError:
+            pass
+
+    def _prune(self):
+        # Other processes may spill to the same directory, so its contents
+        # are listed again rather than tracked. Pages are pruned down to
+        # three quarters of the limit, so that the directory isn't listed
+        # on every spill.
+        pages = _spilled_pages(self.directory)
+        total = sum(size for _, size in pages.values())
+        target = self.max_spill_bytes * 3 // 4
+        for name in sorted(pages, key=lambda name: pages[name][0]):
+            if total <= target:
+                break
+            # The raw page is deleted first, so readers never take a page
+            # whose other encodings are being deleted for a whole one
+            for encoding in sorted(SPILL_SUFFIXES,
+                                   key=lambda encoding: encoding != IDENTITY):
+                path = os.path.join(self.directory,
+                                    name + SPILL_SUFFIXES[encoding])
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= pages[name][1]
+        self._spill_bytes = total
+
+
+def _page_size(page):
+    return sum(len(encoded) for encoded in page.values())
+
+
+def _spilled_pages(directory):
+    """
+    List the pages spilled to a directory.
+
+    Args:
+        directory (str): The spill directory
+
+    Returns:
+        dict[str, tuple]: The last use of each page, as the modification
+        time of its raw encoding (or of its oldest file, if that is
+        missing), and the total size of its files, keyed by the name its
+        files share
+    """
+    raw_mtimes = {}
+    oldest_mtimes = {}
+    sizes = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name, _, suffix = entry.name.partition('.')
+            if '.' + suffix not in SPILL_SUFFIXES.values():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if suffix == 'html':
+                raw_mtimes[name] = stat.st_mtime
+            oldest_mtimes[name] = min(oldest_mtimes.get(name, stat.st_mtime),
+                                      stat.st_mtime)
+            sizes[name] = sizes.get(name, 0) + stat.st_size
+    return {name: (raw_mtimes.get(name, oldest_mtimes[name]), size)
+            for name, size in sizes.items()}
+
+
+def page_etag(key, encoding=IDENTITY):
+    """
+    Build the strong HTTP entity tag of one encoding of a fixed-seed page.
+
+    Args:
+        key (tuple): The page's cache key (see `page_cache_key()`), which
+            holds everything its contents depend on
+        encoding (str): The content encoding the page is sent in
+
+    Returns:
+        str: The quoted entity tag
+    """
+    digest = hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+    if encoding == IDENTITY:
+        return '"{}"'.format(digest)
+    return '"{}-{}"'.format(digest, encoding)
+
+
+def page_cache_key(seed, version, year):
+    """
+    Build the cache key of a fixed-seed page.
+
+    Args:
+        seed (int): The page's random seed
+        version (str): The engine and corpus version it was rendered with
+        year (int): The year printed in the page's prelude
+
+    Returns:
+        tuple
+    """
+    return (seed, version, year)
+
+
+def poem_cache_key(seed, immutable_id, version):
+    """
+    Build the cache key of a single fixed-seed poem's page.
+
+    Args:
+        seed (int): The seed of the book the poem is from
+        immutable_id (int): The poem's ID
+        version (str): The engine and corpus version it was rendered with
+
+    Returns:
+        tuple
+    """
+    return ('poem', seed, immutable_id, version)
+
+
+_render_cache = None
+
+
+def get_render_cache():
+    """
+    Get the process-wide render cache, creating it from settings if needed.
+
+    Returns:
+        Optional[RenderCache]: The cache, or `None` if caching is disabled
+        by setting `RENDER_CACHE_MAX_BYTES` to 0
+    """
+    global _render_cache
+    if _render_cache is None and settings.RENDER_CACHE_MAX_BYTES:
+        _render_cache = RenderCache(settings.RENDER_CACHE_MAX_BYTES,
+                                    settings.RENDER_CACHE_DIR,
+                                    settings.RENDER_CACHE_DIR_MAX_BYTES)
+    return _render_cache
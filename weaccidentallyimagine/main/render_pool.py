@@ -0,0 +1,207 @@
+"""A bounded pool of workers which render books for the async views.
+
+Under ASGI, rendering on the event loop would stall every other request
+until the render finished. `render_page()` instead hands each render to a
+pool of `RENDER_POOL_WORKERS` threads or processes (see `settings.py`), so
+the event loop stays free to answer cached pages and other routes. Renders
+beyond the pool's size wait their turn.
+"""
+
+import asyncio
+from concurrent.futures import (BrokenExecutor, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+import multiprocessing
+import threading
+
+import django
+from django.apps import apps
+from django.conf import settings
+
+from .engine import registry
+from .engine.corpus import corpus_version
+from .engine.timing import RenderTimer
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class RenderPoolShutDown(Exception):
+    """Raised when a render is handed to a pool which has been shut down."""
+
+
+def init_worker():
+    """
+    Set up a process of a pool rendering whole books.
+
+    Passed as the `initializer` of process pools, here and in the bulk
+    rendering commands (see `render_books.py`).
+    """
+    # Spawned worker processes start without Django set up
+    if not apps.ready:
+        django.setup()
+    # Renders are already spread across processes, so each worker renders
+    # its poems one by one rather than starting a pool of its own
+    settings.POEM_POOL_WORKERS = 0
+
+
+def get_render_pool():
+    """
+    Get the process-wide render pool, creating it from settings if needed.
+
+    Returns:
+        concurrent.futures.Executor
+
+    Raises:
+        ValueError: If `RENDER_POOL` is neither `'thread'` nor `'process'`
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if settings.RENDER_POOL == 'process':
+                # Forking a server which is already running threads and an
+                # event loop isn't safe, so workers start from scratch
+                _pool = ProcessPoolExecutor(
+                    settings.RENDER_POOL_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_worker)
+            elif settings.RENDER_POOL == 'thread':
+                _pool = ThreadPoolExecutor(settings.RENDER_POOL_WORKERS,
+                                           thread_name_prefix='render')
+            else:
+                raise ValueError('RENDER_POOL must be "thread" or "process", '
+                                 'not {!r}'.format(settings.RENDER_POOL))
+        return _pool
+
+
+def _render_page(seed, is_fixed, current_year, compress):
+    # Imported here since spawned workers import this module before
+    # Django is set up
+    from .views import render_page
+    timer = RenderTimer()
+    page = render_page(None, seed, is_fixed, current_year, compress, timer)
+    return page, timer
+
+
+def _render_batch_book(seed, immutable_ids):
+    from .views import iter_batch_book
+    timer = RenderTimer()
+    return b''.join(iter_batch_book(seed, immutable_ids, timer)), timer
+
+
+def _call_in_worker(version, function, *args):
+    registry.require_version(version)
+    return function(*args)
+
+
+def _submit(function, *args):
+    try:
+        return get_render_pool().submit(_call_in_worker, corpus_version(),
+                                        function, *args)
+    except BrokenExecutor:
+        raise
+    except RuntimeError as error:
+        # Executors refuse new work with a plain `RuntimeError` once they,
+        # or the interpreter, are shutting down
+        raise RenderPoolShutDown(str(error)) from error
+
+
+def call(function, *args):
+    """
+    Call a function in the render pool and wait for its result.
+
+    Workers run the function with the same poems as this process (see
+    `registry.require_version()`). If a worker can't, the function is
+    called here instead.
+
+    Args:
+        function (callable): A module-level function, so that it can be
+            handed to a worker process
+        *args: Its arguments
+
+    Returns:
+        Whatever `function` returns
+
+    Raises:
+        RenderPoolShutDown: If the render pool has been shut down
+    """
+    try:
+        return _submit(function, *args).result()
+    except registry.StaleCorpusError:
+        return function(*args)
+
+
+async def call_async(function, *args):
+    """
+    Call a function in the render pool without blocking the event loop.
+
+    Like `call()`, except that when a worker can't render with this
+    process's poems, the function is called in a thread of the event
+    loop's default executor.
+
+    Args:
+        function (callable): A module-level function, so that it can be
+            handed to a worker process
+        *args: Its arguments
+
+    Returns:
+        Whatever `function` returns
+    """
+    try:
+        return await asyncio.wrap_future(_submit(function, *args))
+    except registry.StaleCorpusError:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, function, *args)
+
+
+def render_page_blocking(seed, is_fixed, current_year, compress):
+    """
+    Render a whole version of the book in the render pool, waiting for it.
+
+    Args:
+        seed (int): The seed for this version of the book
+        is_fixed (bool): Whether the seed came from the URL
+        current_year (int): The year to print in the prelude
+        compress (bool): Whether to encode the page for the render cache
+
+    Returns:
+        tuple: The page, as returned by `views.render_page()`, and the
+        `RenderTimer` it was rendered with
+
+    Raises:
+        RenderPoolShutDown: If the render pool has been shut down
+    """
+    return call(_render_page, seed, is_fixed, current_year, compress)
+
+
+async def render_page(seed, is_fixed, current_year, compress):
+    """
+    Render a whole version of the book in the render pool.
+
+    Args:
+        seed (int): The seed for this version of the book
+        is_fixed (bool): Whether the seed came from the URL
+        current_year (int): The year to print in the prelude
+        compress (bool): Whether to encode the page for the render cache
+
+    Returns:
+        tuple: The page, as returned by `views.render_page()`, and the
+        `RenderTimer` it was rendered with
+    """
+    return await call_async(_render_page, seed, is_fixed, current_year,
+                            compress)
+
+
+async def render_batch_book(seed, immutable_ids):
+    """
+    Render one book of a batch request in the render pool.
+
+    Args:
+        seed (int): The book's seed
+        immutable_ids (Optional[set[int]]): The IDs of the poems to render,
+            or `None` for every poem
+
+    Returns:
+        tuple[bytes, RenderTimer]: The book's JSON lines, as yielded by
+        `views.iter_batch_book()`, and the timer it was rendered with
+    """
+    return await call_async(_render_batch_book, seed, immutable_ids)
@@ -1,67 +1,747 @@
-"""Views for the application. (Just one view!)"""
+"""Views for the application."""
 
-import os
-import pickle
+import asyncio
+import datetime
+import json
 import random
 
-import blur
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         HttpResponseNotAllowed, HttpResponseNotModified,
+                         StreamingHttpResponse)
 from django.template import loader
 from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_POST
 
-from .engine.soft_poem import SoftPoem
-from .engine.poems import poems as poems_data
+from . import metrics, render_pool
+from .book_queue import get_book_queue
+from .compression import (ENCODINGS, IDENTITY, PREFERENCE, choose_encoding,
+                          compress_page)
+from .engine import poem_pool, registry
+from .engine.corpus import corpus_version
+from .engine.seeded_random import SeededRandom
+from .engine.timing import NULL_TIMER, RenderTimer
+from .page_assembler import get_page_assembler
+from .render_cache import (get_render_cache, page_cache_key, page_etag,
+                           poem_cache_key)
+
+# How long pages which never change may be cached for, in seconds
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def order_poems(poems, rng):
+    """Randomly order the poems by their position weights.
+
+    Args:
+        poems (Sequence[SoftPoem]): The poems to order
+        rng (SeededRandom): The random source to draw from
+
+    Returns:
+        list[SoftPoem]
+    """
+    return rng.weighted_order([(poem, poem.position_weight)
+                               for poem in poems])
+
+
+def render_poems(seed, timer=NULL_TIMER):
+    """Order and render every poem for a version of the book.
+
+    Args:
+        seed (int): The seed for this version of the book
+        timer (RenderTimer): Timer to record the rendering phases in
+
+    Yields:
+        tuple[SoftPoem, str]: Each poem in order, with its rendered body.
+        Unless `settings.POEM_POOL_WORKERS` is set, poems are rendered
+        lazily, as they are requested.
+    """
+    # Create a random source for this render alone, so concurrent
+    # requests in the same process can't disturb each other's draws.
+    # Each poem then draws from its own source (see `poem_pool.py`).
+    rng = SeededRandom(seed)
+    with timer.phase('registry'):
+        poems = registry.get_poems()
+    with timer.phase('ordering'):
+        poems = order_poems(poems, rng)
+    yield from poem_pool.render_poems(poems, seed,
+                                      settings.BATCH_MARKUP_SAMPLING, timer,
+                                      settings.POEM_POOL_WORKERS)
+
+
+def render_book(request, seed, is_fixed, current_year, timer=NULL_TIMER):
+    """Render a whole version of the book to HTML.
+
+    Args:
+        request (django.http.HttpRequest): The request being served
+        seed (int): The seed for this version of the book
+        is_fixed (bool): Whether the seed came from the URL
+        current_year (int): The year to print in the prelude
+        timer (RenderTimer): Timer to record the rendering phases in
+
+    Returns:
+        str: The rendered page
+    """
+    poem_list = list(render_poems(seed, timer))
+    with timer.phase('template'):
+        if settings.ASSEMBLE_PAGES:
+            return get_page_assembler().assemble(seed, is_fixed,
+                                                 current_year, poem_list)
+        template = loader.get_template('main/poem_page.html')
+        # Set up context variables to pass to template rendering
+        render_context = {
+            'seed': seed,
+            'is_fixed': is_fixed,
+            'current_year': current_year,
+            'poem_list': poem_list,
+        }
+        return template.render(render_context, request)
+
+
+def stream_book(request, seed, is_fixed, current_year, timer=NULL_TIMER):
+    """Render a whole version of the book to HTML piece by piece.
+
+    Yields the head of the page (including the info modal and prelude)
+    before any poem is rendered, then each poem's `<article>` as soon as
+    it is ready, then the rest of the page. The joined pieces are the same
+    as the output of `render_book()`.
+
+    Args:
+        request (django.http.HttpRequest): The request being served
+        seed (int): The seed for this version of the book
+        is_fixed (bool): Whether the seed came from the URL
+        current_year (int): The year to print in the prelude
+        timer (RenderTimer): Timer to record the rendering phases in. Time
+            spent assembling the page is counted as part of each poem's
+            markup phase.
+
+    Yields:
+        str: Consecutive pieces of the rendered page
+    """
+    if settings.ASSEMBLE_PAGES:
+        yield from get_page_assembler().iter_page(
+            seed, is_fixed, current_year, render_poems(seed, timer))
+        return
+    head_template = loader.get_template('main/poem_page_head.html')
+    article_template = loader.get_template('main/poem_article.html')
+    foot_template = loader.get_template('main/poem_page_foot.html')
+    render_context = {
+        'seed': seed,
+        'is_fixed': is_fixed,
+        'current_year': current_year,
+    }
+    yield head_template.render(render_context, request)
+    for poem, poem_body in render_poems(seed, timer):
+        article_context = dict(render_context,
+                               poem=poem, poem_body=poem_body)
+        yield article_template.render(article_context, request)
+    yield foot_template.render(render_context, request)
+
+
+def _finish_when_streamed(pieces, timer, cache_status, render_cache=None,
+                          cache_key=None):
+    """Pass through streamed page pieces, then record and cache the page.
+
+    Once the last piece is sent, the render's timings are added to the
+    metrics and, if `render_cache` is given, the page is compressed and
+    cached.
+    """
+    page = []
+    for piece in pieces:
+        encoded_piece = piece.encode()
+        page.append(encoded_piece)
+        yield encoded_piece
+    if render_cache is not None:
+        render_cache.set(cache_key, compress_page(b''.join(page)))
+    metrics.observe_render(timer, cache_status)
 
 
 def main_view(request, seed=None):
-    """The main (and only) view of the application.
+    """The main view of the application.
 
     Renders a version of the book either from a random new seed or from
-    a fixed seed if passed by the URL router.
+    a fixed seed if passed by the URL router. Fixed-seed pages always
+    render the same way, so they are kept in the render cache (see
+    `render_cache.py`) and only rendered again once evicted or once the
+    engine or corpus changes. Cached pages are stored compressed, and sent
+    in whichever encoding the client accepts.
+
+    Fixed-seed pages are also marked as cacheable by browsers and proxies
+    for as long as they can't change, with an entity tag so that a client
+    revalidating a page it already holds is answered without rendering.
+    Random pages are marked as never to be stored, and are taken from the
+    random book queue (see `book_queue.py`) when a book is ready there.
 
     Args:
         request (django.http.HttpRequest): Request object passed automatically
             by URL routing magic.
         seed (Optional[str of digits]): If present, the numerical seed which
-            is passed to the global random state to allow fully reproducible
-            rendering of a specific version of the book.
+            is used to seed this request's random source to allow fully
+            reproducible rendering of a specific version of the book.
+
+    Returns:
+        django.http.HttpResponse: A `StreamingHttpResponse` when
+        `settings.STREAM_RESPONSES` is on and the page isn't cached
+    """
+    timer = RenderTimer()
+    now = timezone.now()
+    seed, is_fixed = _parse_seed(seed)
+    if not is_fixed:
+        response = _queued_response(now.year, timer)
+        if response is None:
+            response = _render_response(request, seed, is_fixed, now.year,
+                                        timer)
+        patch_cache_control(response, no_store=True)
+        return response
+
+    cache_key = page_cache_key(seed, page_version(), now.year)
+    response = _unrendered_response(request, cache_key, timer)
+    if response is None:
+        response = _render_response(request, seed, is_fixed, now.year, timer,
+                                    cache_key)
+    return _fixed_seed_headers(response, now, cache_key)
+
+
+async def main_view_async(request, seed=None):
+    """The main view of the application, for serving over ASGI.
+
+    Behaves like `main_view()`, except that renders are handed to the
+    render pool (see `render_pool.py`) so they never block the event loop.
+    Looking pages up in the render cache and storing them there can read
+    and write spilled pages on disk, so those run in a thread of the event
+    loop's default executor. Responses are never streamed.
+
+    Args:
+        request (django.http.HttpRequest): Request object passed automatically
+            by URL routing magic.
+        seed (Optional[str of digits]): If present, the numerical seed which
+            is used to seed this request's random source to allow fully
+            reproducible rendering of a specific version of the book.
 
     Returns:
         django.http.HttpResponse
     """
-    if not seed:
-        # Assign a random seed that doesn't live in the URL
-        # This seed will be passed to the permalinks in the template
-        seed = random.randint(0, 1000000000000000000)
-        is_fixed = False
+    timer = RenderTimer()
+    now = timezone.now()
+    seed, is_fixed = _parse_seed(seed)
+    if not is_fixed:
+        response = _queued_response(now.year, timer)
+        if response is None:
+            page, render_timer = await render_pool.render_page(
+                seed, is_fixed, now.year, compress=False)
+            timer.merge(render_timer)
+            response = _timed_response(HttpResponse(page), timer, 'none')
+        patch_cache_control(response, no_store=True)
+        return response
+
+    cache_key = page_cache_key(seed, page_version(), now.year)
+    loop = asyncio.get_running_loop()
+    response = await loop.run_in_executor(
+        None, _unrendered_response, request, cache_key, timer)
+    if response is None:
+        render_cache = get_render_cache()
+        page, render_timer = await render_pool.render_page(
+            seed, is_fixed, now.year, compress=render_cache is not None)
+        timer.merge(render_timer)
+        response = await loop.run_in_executor(
+            None, _page_response, request, page, timer, render_cache,
+            cache_key)
+    return _fixed_seed_headers(response, now, cache_key)
+
+
+def poem_view(request, seed, immutable_id):
+    """Render a single poem exactly as it appears in a fixed-seed book.
+
+    Every poem draws from its own random source (see `poem_pool.py`), so
+    one poem can be rendered without rendering the rest of its book.
+
+    Args:
+        request (django.http.HttpRequest): Request object passed automatically
+            by URL routing magic.
+        seed (str of digits): The seed of the book the poem is from
+        immutable_id (str of digits): The poem's ID
+
+    Returns:
+        django.http.HttpResponse
+
+    Raises:
+        django.http.Http404: If no poem has the ID `immutable_id`
+    """
+    timer = RenderTimer()
+    seed = int(seed)
+    try:
+        poem = registry.get_poem(int(immutable_id))
+    except KeyError:
+        raise Http404('There is no poem {}.'.format(immutable_id))
+    cache_key = poem_cache_key(seed, poem.immutable_id, page_version())
+    matched_etag = _matching_etag(request, cache_key)
+    if matched_etag is not None:
+        response = HttpResponseNotModified()
+        response['ETag'] = matched_etag
+        response = _timed_response(response, timer, 'not_modified')
     else:
-        # Be sure to cast str to int
-        seed = int(seed)
-        is_fixed = True
-    # Now apply the seed
-    random.seed(seed)
-    # Load the template
-    template = loader.get_template('main/poem_page.html')
-
-    # Load a list of all of the poems
-    # Use a pickle when available. If not, make one for the future.
-    pickle_file_path = os.path.join('main', 'engine', 'poems_pickle.p')
+        poem_body = poem_pool.render_poem(
+            poem, seed, settings.BATCH_MARKUP_SAMPLING, timer)
+        with timer.phase('template'):
+            page = loader.render_to_string('main/poem_single.html', {
+                'seed': seed,
+                'poem': poem,
+                'poem_body': poem_body,
+            }, request)
+        response = _timed_response(HttpResponse(page), timer, 'none')
+    # Unlike whole books, single poems don't print the year
+    return _immutable_headers(response, cache_key, ONE_YEAR)
+
+
+@require_POST
+def batch_view(request):
+    """Render many fixed-seed books in one request, as JSON lines.
+
+    The request body is a JSON object holding a list of `seeds`, and
+    optionally a list of `poems` IDs to render from each book rather than
+    all of them. For each seed in turn, the response holds one line with
+    the book's poem order:
+
+        {"seed": 7, "version": "4-...", "order": [12, 3, ...]}
+
+    followed by one line for each rendered poem, in book order, holding
+    its HTML body and the attributes the page lays it out with:
+
+        {"seed": 7, "position": 0, "immutable_id": 12, "title": "...",
+         "gap_before": 4.2, "left_pad": 3.1, "html": "<div ..."}
+
+    Every poem renders exactly as it does in the book at `/<seed>`, and
+    lines are streamed as soon as each poem is rendered.
+
+    Args:
+        request (django.http.HttpRequest): Request object passed automatically
+            by URL routing magic.
+
+    Returns:
+        django.http.HttpResponse: A `StreamingHttpResponse` of JSON lines,
+        or a `400 Bad Request` response if the body isn't a valid batch
+    """
     try:
-        with open(pickle_file_path, 'rb') as pickle_file:
-            poems = pickle.load(pickle_file, fix_imports=False)
-    except FileNotFoundError:
-        poems = [SoftPoem(**kwargs) for kwargs in poems_data]
-        with open(pickle_file_path, 'wb') as pickle_file:
-            pickle.dump(poems, pickle_file, fix_imports=False)
-
-    # Order poems
-    poems = blur.rand.weighted_order([(poem, poem.position_weight)
-                                      for poem in poems])
-    # Set up context variables to pass to template rendering
-    render_context = {
+        seeds, immutable_ids = _parse_batch(request.body)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error), content_type='text/plain')
+    response = StreamingHttpResponse(_batch_lines(seeds, immutable_ids),
+                                     content_type='application/x-ndjson')
+    patch_cache_control(response, no_store=True)
+    return response
+
+
+async def batch_view_async(request):
+    """Render many fixed-seed books in one request, for serving over ASGI.
+
+    Takes the same requests and answers with the same lines as
+    `batch_view()`, except that every book is rendered in the render pool
+    (see `render_pool.py`) so the event loop never renders. The ASGI
+    handler can only stream responses by iterating them on the event
+    loop, so the response is sent once every book is rendered.
+
+    Args:
+        request (django.http.HttpRequest): Request object passed automatically
+            by URL routing magic.
+
+    Returns:
+        django.http.HttpResponse
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        seeds, immutable_ids = _parse_batch(request.body)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error), content_type='text/plain')
+    books = await asyncio.gather(*(
+        render_pool.render_batch_book(seed, immutable_ids)
+        for seed in seeds))
+    for book, timer in books:
+        metrics.observe_render(timer, 'batch')
+    response = HttpResponse(b''.join(book for book, timer in books),
+                            content_type='application/x-ndjson')
+    patch_cache_control(response, no_store=True)
+    return response
+
+
+def _parse_batch(body):
+    """Read the seeds and poem IDs of a batch request.
+
+    Args:
+        body (bytes): The request body
+
+    Returns:
+        tuple[list[int], Optional[set[int]]]: The seeds, and the IDs of
+        the poems to render, or `None` for every poem
+
+    Raises:
+        ValueError: If the body isn't a valid batch, with a message saying
+            why
+    """
+    try:
+        batch = json.loads(body)
+    except ValueError:
+        raise ValueError('The request body must be JSON.')
+    if not isinstance(batch, dict):
+        raise ValueError('The request body must be a JSON object.')
+    seeds = batch.get('seeds')
+    if not _is_id_list(seeds) or not seeds:
+        raise ValueError('"seeds" must be a list of non-negative integers.')
+    if len(seeds) > settings.BATCH_MAX_SEEDS:
+        raise ValueError('At most {} seeds may be rendered at once.'
+                         .format(settings.BATCH_MAX_SEEDS))
+    immutable_ids = batch.get('poems')
+    if immutable_ids is None:
+        return seeds, None
+    if not _is_id_list(immutable_ids):
+        raise ValueError('"poems" must be a list of poem IDs.')
+    immutable_ids = set(immutable_ids)
+    known_ids = {poem.immutable_id for poem in registry.get_poems()}
+    if not immutable_ids <= known_ids:
+        raise ValueError('There is no poem {}.'.format(
+            ', '.join(str(immutable_id) for immutable_id
+                      in sorted(immutable_ids - known_ids))))
+    return seeds, immutable_ids
+
+
+def _is_id_list(value):
+    return isinstance(value, list) and all(
+        type(item) is int and item >= 0 for item in value)
+
+
+def _batch_lines(seeds, immutable_ids):
+    """Render the books of a batch request to JSON lines, one by one.
+
+    Args:
+        seeds (list[int]): The seeds of the books to render
+        immutable_ids (Optional[set[int]]): The IDs of the poems to render
+            from each book, or `None` for every poem
+
+    Yields:
+        bytes: Each line, newline included
+    """
+    for seed in seeds:
+        timer = RenderTimer()
+        yield from iter_batch_book(seed, immutable_ids, timer)
+        metrics.observe_render(timer, 'batch')
+
+
+def iter_batch_book(seed, immutable_ids, timer=NULL_TIMER):
+    """Render one book of a batch request to JSON lines.
+
+    See `batch_view()` for the lines yielded.
+
+    Args:
+        seed (int): The book's seed
+        immutable_ids (Optional[set[int]]): The IDs of the poems to render,
+            or `None` for every poem
+        timer (RenderTimer): Timer to record the rendering phases in
+
+    Yields:
+        bytes: Each line, newline included, as soon as it is rendered
+    """
+    rng = SeededRandom(seed)
+    with timer.phase('registry'):
+        poems = registry.get_poems()
+    with timer.phase('ordering'):
+        poems = order_poems(poems, rng)
+    yield _json_line({
         'seed': seed,
-        'is_fixed': is_fixed,
-        'current_year': timezone.now().year,
-        'poem_list': poems,
-    }
-    return HttpResponse(template.render(render_context, request))
+        'version': page_version(),
+        'order': [poem.immutable_id for poem in poems],
+    })
+    positions = {poem.immutable_id: position
+                 for position, poem in enumerate(poems)}
+    if immutable_ids is not None:
+        poems = [poem for poem in poems
+                 if poem.immutable_id in immutable_ids]
+    for poem, poem_body in poem_pool.render_poems(
+            poems, seed, settings.BATCH_MARKUP_SAMPLING, timer,
+            settings.POEM_POOL_WORKERS):
+        yield _json_line({
+            'seed': seed,
+            'position': positions[poem.immutable_id],
+            'immutable_id': poem.immutable_id,
+            'title': poem.title,
+            'gap_before': poem.gap_before,
+            'left_pad': poem.left_pad,
+            'html': poem_body,
+        })
+
+
+def _json_line(value):
+    return (json.dumps(value) + '\n').encode()
+
+
+def _parse_seed(seed):
+    """Get the seed to render from, and whether it came from the URL.
+
+    Args:
+        seed (Optional[str of digits]): The seed captured from the URL
+
+    Returns:
+        tuple[int, bool]: `(seed, is_fixed)`
+    """
+    if not seed:
+        # Assign a random seed that doesn't live in the URL
+        # This seed will be passed to the permalinks in the template
+        return random_seed(), False
+    # Be sure to cast str to int
+    return int(seed), True
+
+
+def random_seed():
+    """Pick a new random seed for a version of the book.
+
+    Returns:
+        int
+    """
+    return random.randint(0, 1000000000000000000)
+
+
+def _queued_response(current_year, timer):
+    """Respond with a random book rendered ahead of time, if one is ready.
+
+    Args:
+        current_year (int): The year the book should print in its prelude
+        timer (RenderTimer): Timer to record taking the book in
+
+    Returns:
+        Optional[django.http.HttpResponse]: The book, or `None` if the
+        random book queue (see `book_queue.py`) is disabled or empty
+    """
+    book_queue = get_book_queue()
+    if book_queue is None:
+        return None
+    with timer.phase('queue'):
+        book = book_queue.pop(page_version(), current_year)
+    if book is None:
+        return None
+    return _timed_response(HttpResponse(book.page), timer, 'queued')
+
+
+def _unrendered_response(request, cache_key, timer):
+    """Answer a fixed-seed request without rendering, if possible.
+
+    Args:
+        request (django.http.HttpRequest): The request being served
+        cache_key (tuple): The page's cache key
+        timer (RenderTimer): Timer to record the cache lookup in
+
+    Returns:
+        Optional[django.http.HttpResponse]: A `304 Not Modified` response
+        if the client already holds the page, the cached page if there is
+        one, or otherwise `None`
+    """
+    render_cache = get_render_cache()
+    # Without the cache, pages are only ever sent raw
+    matched_etag = _matching_etag(
+        request, cache_key,
+        ENCODINGS if render_cache is not None else (IDENTITY,))
+    if matched_etag is not None:
+        response = HttpResponseNotModified()
+        response['ETag'] = matched_etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return _timed_response(response, timer, 'not_modified')
+    if render_cache is None:
+        return None
+    with timer.phase('cache'):
+        page = render_cache.get(cache_key)
+    if page is None:
+        return None
+    return _timed_response(_encoded_response(request, page), timer, 'hit')
+
+
+def render_page(request, seed, is_fixed, current_year, compress,
+                timer=NULL_TIMER):
+    """Render a whole version of the book, optionally compressing it.
+
+    Args:
+        request (Optional[django.http.HttpRequest]): The request being
+            served
+        seed (int): The seed for this version of the book
+        is_fixed (bool): Whether the seed came from the URL
+        current_year (int): The year to print in the prelude
+        compress (bool): Whether to encode the page for the render cache
+        timer (RenderTimer): Timer to record the rendering phases in
+
+    Returns:
+        str or dict[str, bytes]: The rendered page, or if `compress` is
+        set, the page in each of its encodings (see
+        `compression.compress_page()`)
+    """
+    page = render_book(request, seed, is_fixed, current_year, timer)
+    if compress:
+        with timer.phase('compress'):
+            page = compress_page(page.encode())
+    return page
+
+
+def _render_response(request, seed, is_fixed, current_year, timer,
+                     cache_key=None):
+    """Render a page into a response, caching it if `cache_key` is given.
+
+    Returns:
+        django.http.HttpResponse: A `StreamingHttpResponse` when
+        `settings.STREAM_RESPONSES` is on
+    """
+    render_cache = get_render_cache() if cache_key is not None else None
+    if settings.STREAM_RESPONSES:
+        # Headers are sent before the timings are known, so streamed
+        # renders only show up in the metrics
+        pieces = stream_book(request, seed, is_fixed, current_year, timer)
+        response = StreamingHttpResponse(_finish_when_streamed(
+            pieces, timer, _cache_status(render_cache), render_cache,
+            cache_key))
+        if render_cache is not None:
+            # Later responses for this URL will come compressed
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    page = render_page(request, seed, is_fixed, current_year,
+                       render_cache is not None, timer)
+    return _page_response(request, page, timer, render_cache, cache_key)
+
+
+def _cache_status(render_cache):
+    return 'none' if render_cache is None else 'miss'
+
+
+def _page_response(request, page, timer, render_cache=None, cache_key=None):
+    """Respond with a freshly rendered page, caching it if possible.
+
+    Args:
+        request (django.http.HttpRequest): The request being served
+        page (str or dict[str, bytes]): The page as returned by
+            `render_page()`, compressed if `render_cache` is given
+        timer (RenderTimer): Timer the page was rendered with
+        render_cache (Optional[RenderCache]): Cache to store the page in
+        cache_key (Optional[tuple]): The page's cache key
+
+    Returns:
+        django.http.HttpResponse
+    """
+    if render_cache is None:
+        return _timed_response(HttpResponse(page), timer, 'none')
+    render_cache.set(cache_key, page)
+    return _timed_response(_encoded_response(request, page), timer, 'miss')
+
+
+def page_version():
+    """The version of everything a fixed-seed page's contents depend on.
+
+    Batched markup sampling renders seeds differently, so it is part of
+    the version along with the engine and corpus.
+    """
+    version = corpus_version()
+    if settings.BATCH_MARKUP_SAMPLING:
+        version += '-batched'
+    return version
+
+
+def _matching_etag(request, cache_key, encodings=(IDENTITY,)):
+    """Find which of a page's entity tags a request already holds.
+
+    Every fixed seed has a page, so `If-None-Match: *` always matches, as
+    RFC 9110 (section 13.1.2) requires, with the entity tag of the
+    encoding the page would be sent in.
+
+    Args:
+        request (django.http.HttpRequest): The request being served
+        cache_key (tuple): The page's cache key
+        encodings (Iterable[str]): The encodings the page can be sent in
+
+    Returns:
+        Optional[str]: The entity tag of whichever encoding of the page
+        the request's `If-None-Match` header lists, or `None`
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return None
+    if header.strip() == '*':
+        return page_etag(cache_key, choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''), encodings))
+    # If-None-Match uses weak comparison, so weak tags match as well
+    held = {etag[2:] if etag.startswith('W/') else etag
+            for etag in parse_etags(header)}
+    for encoding in PREFERENCE:
+        etag = page_etag(cache_key, encoding)
+        if etag in held:
+            return etag
+    return None
+
+
+def _fixed_seed_headers(response, now, cache_key):
+    """Mark a fixed-seed response as cacheable until it could change.
+
+    A page only changes when the engine or corpus version or the year
+    printed in its prelude does. Version changes come with new entity
+    tags, so the page is held until the end of the year.
+
+    Args:
+        response (django.http.HttpResponse): The response to mark
+        now (datetime.datetime): The time the page was rendered for
+        cache_key (tuple): The page's cache key, to set the response's
+            entity tag from unless it is already set
+
+    Returns:
+        django.http.HttpResponse: `response`
+    """
+    new_year = datetime.datetime(now.year + 1, 1, 1, tzinfo=now.tzinfo)
+    return _immutable_headers(response, cache_key,
+                              int((new_year - now).total_seconds()))
+
+
+def _immutable_headers(response, cache_key, max_age):
+    """Mark a response as never changing for `max_age` seconds.
+
+    Sets the response's entity tag from `cache_key` unless it is already
+    set, and returns the response.
+    """
+    if not response.has_header('ETag'):
+        response['ETag'] = page_etag(
+            cache_key, response.get('Content-Encoding', IDENTITY))
+    patch_cache_control(response, public=True, immutable=True,
+                        max_age=max_age)
+    return response
+
+
+def _encoded_response(request, page):
+    """Respond with the stored encoding of a page the client accepts.
+
+    Args:
+        request (django.http.HttpRequest): The request being served
+        page (dict[str, bytes]): The page in each of its encodings
+
+    Returns:
+        django.http.HttpResponse
+    """
+    encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''),
+                               page)
+    response = HttpResponse(page[encoding])
+    if encoding != IDENTITY:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def _timed_response(response, timer, cache_status):
+    """Record a finished render and add its `Server-Timing` header."""
+    metrics.observe_render(timer, cache_status)
+    response['Server-Timing'] = metrics.server_timing(timer)
+    return response
+
+
+def metrics_view(request):
+    """Serve the aggregated render metrics in the Prometheus text format.
+
+    Args:
+        request (django.http.HttpRequest): Request object passed automatically
+            by URL routing magic.
+
+    Returns:
+        django.http.HttpResponse
+    """
+    return HttpResponse(metrics.render_prometheus(),
+                        content_type='text/plain; version=0.0.4')
@@ -78,3 +78,97 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.10/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Book rendering
+# If True, pages which aren't already cached are streamed poem by poem,
+# so browsers can start laying out the first poems while the rest render.
+
+STREAM_RESPONSES = False
+
+# If True, each poem's random markup decisions (gaps, dashes and breaks)
+# are drawn in a few vectorized batches. This requires NumPy (which isn't
+# in requirements.txt), and renders a given seed differently than the
+# default word-by-word draws. It only pays off for long poems: at around
+# 60 words a poem it is about three times slower than the default, and at
+# 500 words only about 10% faster, so leave it off unless poems run to
+# several hundred words.
+
+BATCH_MARKUP_SAMPLING = False
+
+# If above 0, the poems of each page are rendered concurrently across a
+# pool of this many processes, which cuts the time to render one page on
+# multi-core hosts. Every poem draws from a random source derived from the
+# page's seed, so a seed renders the same book either way.
+
+POEM_POOL_WORKERS = 0
+
+# If True, pages are assembled from static chunks of the templates which
+# are split once at startup (see `main/page_assembler.py`) rather than
+# rendered through the template engine. Both produce the same bytes.
+
+ASSEMBLE_PAGES = True
+
+# Rendered page cache
+# Fixed-seed pages are cached in memory up to this many bytes in total.
+# Set to 0 to disable the cache.
+
+RENDER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# If set, pages evicted from memory are written to this directory and
+# read back from it on a later request.
+
+RENDER_CACHE_DIR = None
+
+# Once the pages in RENDER_CACHE_DIR take up more than this many bytes,
+# those least recently spilled or read are deleted, which includes every
+# page of an engine or corpus version no longer in use. Set to 0 to let the
+# directory grow without limit.
+
+RENDER_CACHE_DIR_MAX_BYTES = 1024 * 1024 * 1024
+
+# Async rendering
+# If True, the main view is routed to its async version, which hands each
+# render to a pool of workers (see `main/render_pool.py`) rather than
+# rendering on the request's thread. Turn this on when serving the site
+# through `asgi.py`.
+
+ASYNC_RENDERING = False
+
+# The kind of workers in the render pool: 'process' renders books in
+# parallel across CPUs, 'thread' shares this process (and its GIL) but
+# starts instantly and uses less memory.
+
+RENDER_POOL = 'process'
+
+# Most renders in progress at once. Further renders wait for a free worker.
+
+RENDER_POOL_WORKERS = os.cpu_count()
+
+# Random book queue
+# Pages for `/` are rendered ahead of time from random seeds by a background
+# thread (see `main/book_queue.py`), which keeps up to this many ready.
+# Set to 0 to render every random page on request.
+
+RANDOM_BOOK_QUEUE_DEPTH = 8
+
+# Most books the background thread renders a second while refilling the
+# queue.
+
+RANDOM_BOOK_QUEUE_REFILL_RATE = 4
+
+# Corpus reloading
+# If above 0, a background thread checks `poems.py` and the texts for edits
+# this many seconds apart (see `main/engine/corpus_watcher.py`), and swaps
+# in rebuilt poems without restarting the server. Set to 0 to only read
+# them at startup.
+
+CORPUS_RELOAD_INTERVAL = 2
+
+# Batch API
+# Most seeds one request to `/batch` may render (see `main/views.py`). A
+# book takes tens of milliseconds to render, so this bounds how long one
+# request can keep a worker busy (or, under ASGI, how many books it queues
+# in the render pool at once, and holds in memory until all are done).
+
+BATCH_MAX_SEEDS = 50
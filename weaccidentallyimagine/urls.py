@@ -1,16 +1,30 @@
 """URL Routing"""
 
+from django.conf import settings
 from django.conf.urls import url
 from django.http import HttpResponse
 
 from main import views
 
+# Under ASGI, renders are handed to a pool so they don't block the event loop
+main_view = (views.main_view_async if settings.ASYNC_RENDERING
+             else views.main_view)
+batch_view = (views.batch_view_async if settings.ASYNC_RENDERING
+              else views.batch_view)
+
 urlpatterns = [
     # Root goes to main view, generating a random version
-    url(r'^$', views.main_view, name=''),
+    url(r'^$', main_view, name=''),
+    # Render timing metrics in the Prometheus text format
+    url(r'^metrics$', views.metrics_view, name='metrics'),
+    # Many fixed-seed books rendered at once as JSON lines, for bulk export
+    url(r'^batch$', batch_view, name='batch'),
+    # A single poem as it appears in the book of a fixed seed
+    url(r'^(?P<seed>[0-9]+)/(?P<immutable_id>[0-9]+)$', views.poem_view,
+        name='poem'),
     # Pass any present numerical random seed to the view for
     # reproducible rendering
-    url(r'(?P<seed>[0-9]+)$', views.main_view, name=''),
+    url(r'(?P<seed>[0-9]+)$', main_view, name=''),
     # robots.txt --- Tell webcrawlers to ignore fixed seed links
     # (Will crawlers get confused about all this anyway???)
     url(r'^robots.txt$', lambda r: HttpResponse(